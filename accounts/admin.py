@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, UserProfile, SavedProperty, Consultation, Notification
+from .models import CustomUser, UserProfile, SavedProperty, Consultation, Notification, UserAgent, OutboundEmail
 
 @admin.register(CustomUser)
 class CustomUserAdmin(UserAdmin):
@@ -22,6 +22,20 @@ class CustomUserAdmin(UserAdmin):
     search_fields = ('email', 'first_name', 'last_name')
     ordering = ('email',)
 
+@admin.register(UserAgent)
+class UserAgentAdmin(admin.ModelAdmin):
+    list_display = ('browser', 'browser_version', 'os', 'device_type', 'created_at')
+    list_filter = ('device_type', 'browser', 'os')
+    search_fields = ('raw',)
+    readonly_fields = ('raw', 'raw_hash', 'browser', 'browser_version', 'os', 'device_type', 'created_at')
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'to')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'phone_number', 'location')
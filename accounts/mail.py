@@ -0,0 +1,121 @@
+"""
+SMTP backend that keeps authenticated connections open between sends.
+
+Django's SMTP backend connects, negotiates TLS and logs in for every
+``send_mail`` call and quits afterwards. ``PooledSMTPBackend`` hands the
+connection back to a per-process pool on ``close()`` instead, and the
+next ``open()`` reuses it after a ``NOOP`` health check. Connections
+idle for longer than ``EMAIL_POOL_IDLE_TIMEOUT`` seconds are quit rather
+than reused (most servers drop them after a minute or so anyway) and at
+most ``EMAIL_POOL_SIZE`` idle connections are kept per server.
+
+Enable it with ``EMAIL_BACKEND = 'accounts.mail.PooledSMTPBackend'``.
+"""
+import atexit
+import os
+import smtplib
+import ssl
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail.backends.smtp import EmailBackend
+
+
+def _quit(connection):
+    try:
+        connection.quit()
+    except (smtplib.SMTPException, ssl.SSLError, OSError):
+        connection.close()
+
+
+class SMTPConnectionPool:
+    """Idle SMTP connections per (host, port, user, security) key, most recently used first."""
+
+    def __init__(self):
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Sockets inherited over fork() belong to the parent; forget them without QUIT
+        if self._pid != os.getpid():
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def acquire(self, key, idle_timeout):
+        """A live pooled connection for ``key``, or None if the caller must connect."""
+        while True:
+            with self._lock:
+                self._check_pid()
+                idle = self._idle.get(key)
+                if not idle:
+                    return None
+                connection, released_at = idle.pop()
+            if time.monotonic() - released_at > idle_timeout:
+                _quit(connection)
+                continue
+            try:
+                if connection.noop()[0] == 250:
+                    return connection
+            except (smtplib.SMTPException, OSError):
+                pass
+            connection.close()
+
+    def release(self, key, connection, max_size):
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < max_size:
+                idle.append((connection, time.monotonic()))
+                return
+        _quit(connection)
+
+    def idle_count(self, key=None):
+        with self._lock:
+            if key is not None:
+                return len(self._idle.get(key, ()))
+            return sum(len(idle) for idle in self._idle.values())
+
+    def clear(self):
+        """Quit every idle connection."""
+        with self._lock:
+            self._check_pid()
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                _quit(connection)
+
+
+smtp_pool = SMTPConnectionPool()
+atexit.register(smtp_pool.clear)
+
+
+class PooledSMTPBackend(EmailBackend):
+    def __init__(self, *args, pool_size=None, idle_timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_size = pool_size if pool_size is not None else getattr(settings, 'EMAIL_POOL_SIZE', 4)
+        self.idle_timeout = idle_timeout if idle_timeout is not None else getattr(settings, 'EMAIL_POOL_IDLE_TIMEOUT', 30)
+
+    @property
+    def pool_key(self):
+        return (self.host, self.port, self.username, self.use_tls, self.use_ssl)
+
+    def open(self):
+        if self.connection:
+            return False
+        connection = smtp_pool.acquire(self.pool_key, self.idle_timeout)
+        if connection is not None:
+            self.connection = connection
+            return True
+        return super().open()
+
+    def close(self):
+        """Return the connection to the pool unless the server has dropped it."""
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        if getattr(connection, 'sock', None) is None:
+            connection.close()
+            return
+        smtp_pool.release(self.pool_key, connection, self.pool_size)
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import LoginSession
+from accounts.useragents import resolve_user_agent
+from properties.models import PropertyView
+
+LEGACY_COLUMN = 'user_agent'
+
+
+class Command(BaseCommand):
+    help = (
+        "Move raw User-Agent strings from the old user_agent text columns of PropertyView and "
+        "LoginSession into UserAgent rows and link them through user_agent_id. Run with "
+        "--drop-legacy before deploying: the old NOT NULL column rejects new inserts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drop-legacy', action='store_true', help="Drop the old text column once converted")
+
+    def handle(self, *args, **options):
+        for model in (PropertyView, LoginSession):
+            table = model._meta.db_table
+            with connection.cursor() as cursor:
+                columns = {column.name for column in connection.introspection.get_table_description(cursor, table)}
+            if LEGACY_COLUMN not in columns:
+                self.stdout.write(f"{table}: no legacy {LEGACY_COLUMN} column, nothing to convert")
+                continue
+
+            field = model._meta.get_field('user_agent')
+            quote = connection.ops.quote_name
+            if field.column not in columns:
+                # Plain ADD COLUMN: the SQLite schema editor would rebuild the table and lose the old column
+                target = field.related_model._meta
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        f"ALTER TABLE {quote(table)} ADD COLUMN {quote(field.column)} {field.db_type(connection)} NULL "
+                        f"REFERENCES {quote(target.db_table)} ({quote(target.pk.column)})"
+                    )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT DISTINCT {quote(LEGACY_COLUMN)} FROM {quote(table)} "
+                    f"WHERE {quote(field.column)} IS NULL AND {quote(LEGACY_COLUMN)} IS NOT NULL"
+                )
+                strings = [row[0] for row in cursor.fetchall()]
+
+            rows = 0
+            # One UPDATE per distinct string; there are few of them compared to rows
+            for raw in strings:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(
+                        f"UPDATE {quote(table)} SET {quote(field.column)} = %s "
+                        f"WHERE {quote(LEGACY_COLUMN)} = %s AND {quote(field.column)} IS NULL",
+                        [resolve_user_agent(raw), raw],
+                    )
+                    rows += cursor.rowcount
+
+            if options['drop_legacy']:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"ALTER TABLE {quote(table)} DROP COLUMN {quote(LEGACY_COLUMN)}")
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {table}: linked {rows} rows to {len(strings)} distinct user agents"
+            ))
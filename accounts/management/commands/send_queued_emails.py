@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import OUTBOX_BATCH_SIZE, deliver_pending
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OutboundEmail rows, one SMTP connection per batch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help="Keep polling instead of exiting when the outbox is drained")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds between polls with --loop")
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver_pending(batch_size=options['batch_size'])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"✅ Sent {total_sent} emails ({total_failed} failed, will retry)"))
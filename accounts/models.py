@@ -89,12 +89,40 @@ class PrivacySettings(models.Model):
     def __str__(self):
         return f"{self.user.get_full_name()} Privacy Settings"
 
+class UserAgent(models.Model):
+    """Each distinct User-Agent string, stored once with its parsed fields."""
+    DEVICE_CHOICES = [
+        ('desktop', 'Desktop'),
+        ('mobile', 'Mobile'),
+        ('tablet', 'Tablet'),
+        ('bot', 'Bot'),
+        ('other', 'Other'),
+    ]
+
+    raw = models.TextField(blank=True)
+    raw_hash = models.CharField(max_length=40, unique=True)  # sha1 of raw; TEXT can be too long to index
+    browser = models.CharField(max_length=50, blank=True)
+    browser_version = models.CharField(max_length=20, blank=True)
+    os = models.CharField(max_length=50, blank=True)
+    device_type = models.CharField(max_length=10, choices=DEVICE_CHOICES, default='other')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.raw
+
+    @property
+    def label(self):
+        if self.browser and self.os:
+            return f"{self.browser} on {self.os}"
+        return self.browser or self.os or 'Unknown'
+
+
 class LoginSession(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='login_sessions')
     device = models.CharField(max_length=255)
     location = models.CharField(max_length=255)
     ip_address = models.GenericIPAddressField()
-    user_agent = models.TextField()
+    user_agent = models.ForeignKey(UserAgent, on_delete=models.PROTECT, null=True, related_name='login_sessions')
     session_key = models.CharField(max_length=40, blank=True, null=True)
     last_active = models.DateTimeField(auto_now=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -102,6 +130,35 @@ class LoginSession(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.device}"
 
+class OutboundEmail(models.Model):
+    """Outbox row written with the data it reports on; delivered by `send_queued_emails`."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['next_attempt_at'], name='outbox_pending_idx', condition=models.Q(status='pending')),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
 class SavedProperty(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="account_saved_properties")
     property = models.ForeignKey('properties.Property', on_delete=models.CASCADE)
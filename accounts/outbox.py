@@ -0,0 +1,114 @@
+"""
+Transactional email outbox.
+
+Views call ``queue_email`` inside the transaction that saves the row the
+email is about, so a message is queued if and only if that row is
+committed, and the request never waits on SMTP. ``deliver_pending``
+(run by the ``send_queued_emails`` command) claims due messages in
+batches, sends each batch over a single backend connection, and
+reschedules failures with exponential backoff until
+``EMAIL_OUTBOX_MAX_ATTEMPTS`` is reached.
+"""
+import logging
+import smtplib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 100
+# A claimed message is retried by another worker if not finished by then
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def _max_attempts():
+    return getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 6)
+
+
+def retry_delay(attempts):
+    """Backoff before the next try after ``attempts`` failures: base, 2x, 4x ... capped at a day."""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_DELAY', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 60 * 60 * 24))
+
+
+def queue_mass_email(datatuple):
+    """
+    Queue several plain-text emails with one insert. ``datatuple`` is in
+    ``send_mass_mail`` form: ``(subject, message, from_email, recipient_list)``
+    with ``from_email`` None for DEFAULT_FROM_EMAIL.
+    """
+    emails = []
+    for subject, body, from_email, to in datatuple:
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        # Build the MIME message now so bad headers fail the request, as send_mail did
+        EmailMessage(subject, body, from_email, list(to)).message()
+        emails.append(OutboundEmail(subject=subject, body=body, from_email=from_email, to=list(to)))
+    return OutboundEmail.objects.bulk_create(emails)
+
+
+def queue_email(subject, body, to, from_email=None):
+    """Queue a plain-text email; call inside the transaction that saves the related data."""
+    return queue_mass_email([(subject, body, from_email, to)])[0]
+
+
+def _claim(batch_size):
+    """Lease up to ``batch_size`` due messages to this worker."""
+    now = timezone.now()
+    due = list(
+        OutboundEmail.objects.filter(status='pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at')[:batch_size]
+    )
+    claimed = []
+    for email in due:
+        lease = now + CLAIM_LEASE
+        # Conditional update: only one worker wins each row
+        if OutboundEmail.objects.filter(pk=email.pk, next_attempt_at=email.next_attempt_at).update(next_attempt_at=lease):
+            email.next_attempt_at = lease
+            claimed.append(email)
+    return claimed
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)[:2000]
+    if email.attempts >= _max_attempts():
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+    email.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+def deliver_pending(batch_size=OUTBOX_BATCH_SIZE, connection=None):
+    """Send one batch of due messages over one connection; returns (sent, failed)."""
+    emails = _claim(batch_size)
+    if not emails:
+        return 0, 0
+    connection = connection or get_connection()
+    sent = failed = 0
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                # No-op while the connection is up; reconnects after a drop
+                connection.open()
+                message.send()
+            except Exception as exc:
+                logger.warning("Email %s failed", email.pk, exc_info=True)
+                _record_failure(email, exc)
+                failed += 1
+                if isinstance(exc, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+                    connection.close()
+                continue
+            email.status = 'sent'
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.save(update_fields=['status', 'attempts', 'sent_at'])
+            sent += 1
+    finally:
+        connection.close()
+    return sent, failed
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import io
+import socket
+import socketserver
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from agents.models import Agent
+from properties.models import Property
+
+from . import mail as pooled_mail, outbox
+from .models import CustomUser, LoginSession, OutboundEmail, UserAgent
+from .useragents import clear_user_agent_cache, describe_user_agent, parse_user_agent, resolve_user_agent
+
+
+class EmailOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        agent = Agent.objects.create(
+            name='Test Agent', title='Senior Agent', description='Test agent',
+            phone='9999999999', email='agent@example.com', experience=5,
+        )
+        cls.prop = Property.objects.create(
+            title='Test Property', description='A test property', status='for_sale', type='apartment',
+            price=5000000, location='Civil Lines, Nagpur', pincode='440001', total_area=1200,
+            bedrooms=2, bathrooms=2, year_built=2020, agent=agent,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def schedule(self, **overrides):
+        data = {
+            'name': 'Visitor', 'email': 'visitor@example.com', 'phone': '9000000000',
+            'preferred_date': '2026-01-10', 'preferred_time': '10:00',
+        }
+        data.update(overrides)
+        return self.client.post(reverse('properties:schedule_visit', args=[self.prop.id]), data)
+
+    def test_visit_queues_mail_without_sending(self):
+        response = self.schedule()
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('to', flat=True)),
+            [['agent@example.com'], ['visitor@example.com']],
+        )
+
+        self.assertEqual(outbox.deliver_pending(), (2, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(OutboundEmail.objects.filter(status='sent').count(), 2)
+        self.assertEqual(outbox.deliver_pending(), (0, 0))
+
+    def test_bad_header_is_rejected_before_queueing(self):
+        with self.assertRaises(mail.BadHeaderError):
+            outbox.queue_email('Line\nbreak', 'body', ['a@example.com'])
+        self.assertFalse(OutboundEmail.objects.exists())
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=60)
+    def test_failures_back_off_then_give_up(self):
+        email = outbox.queue_email('Hello', 'body', ['a@example.com'])
+        connection = mock.Mock()
+        connection.send_messages.side_effect = ConnectionError('refused')
+
+        with self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(outbox.deliver_pending(connection=connection), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=50))
+        # Not due yet
+        self.assertEqual(outbox.deliver_pending(connection=connection), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=timezone.now())
+        with self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(outbox.deliver_pending(connection=connection), (0, 1))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('failed', 2))
+        self.assertIn('refused', email.last_error)
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    """Minimal local SMTP server that accepts everything and counts connections and messages."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write(line.encode() + b'\r\n')
+
+        def handle(self):
+            server = self.server
+            server.connections += 1
+            server.sockets.append(self.connection)
+            self.reply('220 localhost debug')
+            while line := self.rfile.readline():
+                command = line.decode().strip().upper()
+                if command.startswith('EHLO'):
+                    self.reply('250 localhost')
+                elif command == 'DATA':
+                    self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    while self.rfile.readline() not in (b'.\r\n', b''):
+                        pass
+                    server.messages += 1
+                    self.reply('250 OK')
+                elif command == 'QUIT':
+                    self.reply('221 Bye')
+                    return
+                else:
+                    self.reply('250 OK')
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), self.Handler)
+        self.connections = self.messages = 0
+        self.sockets = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def drop_connections(self):
+        for sock in self.sockets:
+            sock.shutdown(socket.SHUT_RDWR)
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class PooledSMTPBackendTests(TestCase):
+    def setUp(self):
+        self.server = DebugSMTPServer()
+        self.addCleanup(self.server.stop)
+        pooled_mail.smtp_pool.clear()
+        self.addCleanup(pooled_mail.smtp_pool.clear)
+
+    def backend(self, **kwargs):
+        return pooled_mail.PooledSMTPBackend(host='127.0.0.1', port=self.server.server_address[1], **kwargs)
+
+    def send(self, backend, count=1):
+        messages = [mail.EmailMessage('Hi', 'body', 'from@example.com', ['to@example.com']) for _ in range(count)]
+        return backend.send_messages(messages)
+
+    def test_connection_is_reused_across_sends(self):
+        for _ in range(20):
+            self.assertEqual(self.send(self.backend()), 1)
+        self.assertEqual(self.server.messages, 20)
+        self.assertEqual(self.server.connections, 1)
+        self.assertEqual(pooled_mail.smtp_pool.idle_count(), 1)
+
+    def test_stale_connections_are_replaced(self):
+        self.send(self.backend())
+        # A server-side drop is noticed by the NOOP health check
+        self.server.drop_connections()
+        self.assertEqual(self.send(self.backend()), 1)
+        self.assertEqual(self.server.connections, 2)
+
+        # Idle past the timeout: quit and reconnect instead of reusing
+        self.assertEqual(self.send(self.backend(idle_timeout=0)), 1)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_outbox_batches_share_a_pooled_connection(self):
+        outbox.queue_mass_email([('Hi', 'body', None, [f'user{i}@example.com']) for i in range(30)])
+        with override_settings(EMAIL_BACKEND='accounts.mail.PooledSMTPBackend', EMAIL_HOST='127.0.0.1', EMAIL_PORT=self.server.server_address[1]):
+            self.assertEqual(outbox.deliver_pending(batch_size=10), (10, 0))
+            self.assertEqual(outbox.deliver_pending(batch_size=10), (10, 0))
+            self.assertEqual(outbox.deliver_pending(batch_size=10), (10, 0))
+        self.assertEqual(self.server.messages, 30)
+        self.assertEqual(self.server.connections, 1)
+
+
+class UserAgentTests(TestCase):
+    """User-Agent strings are parsed once and stored once."""
+
+    def setUp(self):
+        # Ids cached by simulated commits would outlive the test's rollback
+        self.addCleanup(clear_user_agent_cache)
+
+    def test_parse_common_agents(self):
+        chrome = parse_user_agent(
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) '
+            'Chrome/120.0.0.0 Safari/537.36'
+        )
+        self.assertEqual((chrome['browser'], chrome['browser_version'], chrome['os'], chrome['device_type']),
+                         ('Chrome', '120', 'Windows', 'desktop'))
+        iphone = parse_user_agent(
+            'Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 '
+            '(KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1'
+        )
+        self.assertEqual((iphone['browser'], iphone['os'], iphone['device_type']), ('Safari', 'iOS', 'mobile'))
+        self.assertEqual(parse_user_agent('Googlebot/2.1 (+http://www.google.com/bot.html)')['device_type'], 'bot')
+
+    def test_resolve_interns_through_lru(self):
+        raw = 'Mozilla/5.0 (X11; Linux x86_64) Firefox/121.0'
+        with self.captureOnCommitCallbacks(execute=True):
+            first = resolve_user_agent(raw)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_user_agent(raw), first)
+        self.assertEqual(describe_user_agent(raw), 'Firefox on Linux')
+        clear_user_agent_cache()
+        self.assertEqual(resolve_user_agent(raw), first)
+        self.assertEqual(UserAgent.objects.count(), 1)
+
+    def test_rolled_back_or_deleted_rows_are_not_cached(self):
+        raw = 'Mozilla/5.0 (Windows NT 10.0) Chrome/120.0'
+        try:
+            with transaction.atomic():
+                resolve_user_agent(raw)
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(UserAgent.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            first = resolve_user_agent(raw)
+        UserAgent.objects.filter(pk=first).get().delete()
+        self.assertNotEqual(resolve_user_agent(raw), first)
+
+    def test_convert_legacy_strings(self):
+        user = CustomUser.objects.create_user(username='member', email='member@example.com', password=None)
+        with connection.cursor() as cursor:
+            cursor.execute('ALTER TABLE accounts_loginsession ADD COLUMN user_agent text NULL')
+            for ip, raw in (('1.2.3.4', 'curl/8.0'), ('1.2.3.5', 'curl/8.0'), ('1.2.3.6', 'Mozilla/5.0 (X11; Linux x86_64) Firefox/121.0')):
+                cursor.execute(
+                    'INSERT INTO accounts_loginsession (user_id, device, location, ip_address, user_agent, last_active, created_at) '
+                    'VALUES (%s, %s, %s, %s, %s, %s, %s)', [user.id, '', '', ip, raw, timezone.now(), timezone.now()],
+                )
+        call_command('convert_user_agents', '--drop-legacy', stdout=io.StringIO())
+        self.assertEqual(UserAgent.objects.count(), 2)
+        self.assertEqual(
+            sorted(LoginSession.objects.values_list('user_agent__device_type', flat=True)),
+            ['bot', 'bot', 'desktop'],
+        )
+
+    def test_long_strings_are_truncated(self):
+        pk = resolve_user_agent('x' * 10000)
+        self.assertEqual(len(UserAgent.objects.get(pk=pk).raw), 512)
+        self.assertEqual(resolve_user_agent('x' * 600), pk)
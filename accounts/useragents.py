@@ -0,0 +1,125 @@
+"""
+Interning of User-Agent strings into the UserAgent dimension table.
+
+The same few hundred strings account for nearly all traffic, so writers
+resolve a string to its UserAgent id through an in-process LRU and only
+hit the database for a string the process has not seen yet. Parsing is
+a handful of regular expressions and happens once per distinct string.
+
+The LRU is keyed by the hash of the (truncated) string and holds only
+ids. An id is cached once the transaction that looked it up commits, so
+a rolled-back insert never leaves a dangling id behind, and deleting a
+UserAgent evicts it.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models.signals import post_delete
+
+from .models import UserAgent
+
+USER_AGENT_CACHE_SIZE = 4096
+# Longer strings are junk or abuse; only this much is stored and hashed
+MAX_USER_AGENT_LENGTH = 512
+
+BOT_PATTERN = re.compile(r'bot|crawl|spider|slurp|curl|wget|python-requests|headless|monitor', re.I)
+
+# Checked in order: several browsers also announce "Chrome" or "Safari"
+BROWSER_PATTERNS = [
+    ('Edge', re.compile(r'Edg(?:e|A|iOS)?/(\d+)')),
+    ('Opera', re.compile(r'(?:OPR|Opera)/(\d+)')),
+    ('Samsung Internet', re.compile(r'SamsungBrowser/(\d+)')),
+    ('Firefox', re.compile(r'(?:Firefox|FxiOS)/(\d+)')),
+    ('Chrome', re.compile(r'(?:Chrome|CriOS)/(\d+)')),
+    ('Safari', re.compile(r'Version/(\d+).*Safari')),
+    ('Internet Explorer', re.compile(r'(?:MSIE |Trident/.*rv:)(\d+)')),
+]
+
+OS_PATTERNS = [
+    ('iOS', re.compile(r'iPhone|iPad|iPod')),
+    ('Android', re.compile(r'Android')),
+    ('Windows', re.compile(r'Windows')),
+    ('macOS', re.compile(r'Macintosh|Mac OS X')),
+    ('ChromeOS', re.compile(r'CrOS')),
+    ('Linux', re.compile(r'Linux')),
+]
+
+
+def parse_user_agent(raw):
+    """Return the browser, browser_version, os and device_type fields for a string."""
+    browser = version = os_name = ''
+    for name, pattern in BROWSER_PATTERNS:
+        match = pattern.search(raw)
+        if match:
+            browser, version = name, match.group(1)
+            break
+    for name, pattern in OS_PATTERNS:
+        if pattern.search(raw):
+            os_name = name
+            break
+
+    if BOT_PATTERN.search(raw):
+        device_type = 'bot'
+    elif re.search(r'iPad|Tablet', raw) or (os_name == 'Android' and 'Mobile' not in raw):
+        device_type = 'tablet'
+    elif re.search(r'Mobi|iPhone|iPod', raw):
+        device_type = 'mobile'
+    elif os_name:
+        device_type = 'desktop'
+    else:
+        device_type = 'other'
+    return {'browser': browser, 'browser_version': version, 'os': os_name, 'device_type': device_type}
+
+
+_ids = OrderedDict()
+_ids_lock = threading.Lock()
+
+
+def _remember(digest, pk):
+    with _ids_lock:
+        _ids[digest] = pk
+        _ids.move_to_end(digest)
+        while len(_ids) > USER_AGENT_CACHE_SIZE:
+            _ids.popitem(last=False)
+
+
+def clear_user_agent_cache():
+    with _ids_lock:
+        _ids.clear()
+
+
+def user_agent_hash(raw):
+    return hashlib.sha1(raw.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def resolve_user_agent(raw):
+    """Id of the UserAgent row for a string, created on first sight."""
+    raw = (raw or '')[:MAX_USER_AGENT_LENGTH]
+    digest = user_agent_hash(raw)
+    with _ids_lock:
+        pk = _ids.get(digest)
+        if pk is not None:
+            _ids.move_to_end(digest)
+            return pk
+    user_agent, _ = UserAgent.objects.get_or_create(
+        raw_hash=digest, defaults={'raw': raw, **parse_user_agent(raw)},
+    )
+    pk = user_agent.pk
+    transaction.on_commit(lambda: _remember(digest, pk))
+    return pk
+
+
+def describe_user_agent(raw):
+    """Short "Browser on OS" label for a string, without touching the database."""
+    return UserAgent(**parse_user_agent((raw or '')[:MAX_USER_AGENT_LENGTH])).label
+
+
+def _forget(sender, instance, **kwargs):
+    with _ids_lock:
+        _ids.pop(instance.raw_hash, None)
+
+
+post_delete.connect(_forget, sender=UserAgent, dispatch_uid='accounts.useragents.forget')
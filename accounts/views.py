@@ -10,9 +10,11 @@ import json
 import csv
 from .models import CustomUser, UserProfile, UserPreferences, NotificationSettings, PrivacySettings, LoginSession, SavedProperty, Consultation, Notification
 from .forms import CustomAuthenticationForm, CustomUserCreationForm, ProfilePictureForm, UserProfileForm, PasswordChangeForm, PreferencesForm, NotificationSettingsForm, PrivacySettingsForm, DeleteAccountForm, NewsletterForm, ProfileForm
+from .useragents import describe_user_agent, resolve_user_agent
 from django.shortcuts import render
 from properties.models import Property
 from properties.models import SavedProperty
+from properties.locations import sorted_locations
 from django.db import transaction
 
 from blog.models import BlogPost  # Correct import
@@ -66,13 +68,11 @@ def home(request):
     featured_properties = Property.objects.filter(featured=True).order_by('-created_at')[:6]
     # Latest blog posts (published only)
     latest_posts = BlogPost.objects.filter(status='published').order_by('-published_date')[:3]
-    # Locations for the search form
-    locations = Property.objects.filter(is_active=True).values_list('location', flat=True).distinct()
-
     context = {
         'featured_properties': featured_properties,
         'latest_posts': latest_posts,
-        'locations': sorted([loc for loc in locations if loc]),
+        # Locations for the search form, from the cached location dictionary
+        'locations': sorted_locations(),
     }
     return render(request, 'accounts/home.html', context)
 
@@ -84,7 +84,7 @@ def settings_view(request):
     privacy_settings, created = PrivacySettings.objects.get_or_create(user=request.user)
     
     # Get active sessions
-    sessions = LoginSession.objects.filter(user=request.user).order_by('-last_active')
+    sessions = LoginSession.objects.filter(user=request.user).select_related('user_agent').order_by('-last_active')
     
     context = {
         'profile_form': UserProfileForm(instance=profile),
@@ -307,12 +307,13 @@ def login_view(request):
                     request.session.set_expiry(0)
                 
                 # Log login session
+                raw_user_agent = request.META.get('HTTP_USER_AGENT', '')
                 LoginSession.objects.create(
                     user=user,
-                    device=request.META.get('HTTP_USER_AGENT', 'Unknown'),
+                    device=describe_user_agent(raw_user_agent),
                     location=f"{request.META.get('REMOTE_ADDR', 'Unknown')}",
                     ip_address=request.META.get('REMOTE_ADDR', ''),
-                    user_agent=request.META.get('HTTP_USER_AGENT', '')
+                    user_agent_id=resolve_user_agent(raw_user_agent)
                 )
                 
                 return redirect('profile')
@@ -348,7 +349,7 @@ def profile_view(request):
     )
     consultations = request.user.consultations.select_related('agent').all()
     notifications = request.user.notifications.filter(is_read=False)
-    sessions = LoginSession.objects.filter(user=request.user).order_by('-last_active')
+    sessions = LoginSession.objects.filter(user=request.user).select_related('user_agent').order_by('-last_active')
     
     context = {
         'company': Company.objects.first(),
@@ -584,12 +585,13 @@ def login_view(request):
                     request.session.set_expiry(0)
                 
                 # Log login session
+                raw_user_agent = request.META.get('HTTP_USER_AGENT', '')
                 LoginSession.objects.create(
                     user=user,
-                    device=request.META.get('HTTP_USER_AGENT', 'Unknown'),
+                    device=describe_user_agent(raw_user_agent),
                     location=f"{request.META.get('REMOTE_ADDR', 'Unknown')}",
                     ip_address=request.META.get('REMOTE_ADDR', ''),
-                    user_agent=request.META.get('HTTP_USER_AGENT', ''),
+                    user_agent_id=resolve_user_agent(raw_user_agent),
                     session_key=request.session.session_key
                 )
                 
@@ -653,7 +655,7 @@ def profile_view(request):
         notifications = []
 
     # ✅ Get user sessions
-    sessions = LoginSession.objects.filter(user=request.user).order_by("-last_active")
+    sessions = LoginSession.objects.filter(user=request.user).select_related("user_agent").order_by("-last_active")
 
     # ✅ Context for template
     context = {
@@ -698,7 +700,7 @@ def settings_view(request):
     
     # Get active sessions
     try:
-        sessions = LoginSession.objects.filter(user=request.user).order_by('-last_active')
+        sessions = LoginSession.objects.filter(user=request.user).select_related('user_agent').order_by('-last_active')
     except:
         sessions = []
     
@@ -1,3 +1,39 @@
+from unittest import mock
+
+from django.conf import settings
 from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import OutboundEmail
+
+from .models import Agent, ContactMessage
+
+
+class ContactAgentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = Agent.objects.create(
+            name='Test Agent', title='Senior Agent', description='Test agent',
+            phone='9999999999', email='agent@example.com', experience=5,
+        )
+
+    def contact(self, **overrides):
+        data = {'name': 'Visitor', 'email': 'visitor@example.com', 'phone': '9000000000', 'message': 'Hello'}
+        data.update(overrides)
+        return self.client.post(reverse('agents:contact_agent', args=[self.agent.id]), data)
+
+    def test_message_and_email_are_saved_together(self):
+        self.assertTrue(self.contact().json()['success'])
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertEqual(OutboundEmail.objects.get().to, ['agent@example.com', settings.DEFAULT_FROM_EMAIL])
+
+    def test_failed_queueing_saves_nothing(self):
+        response = self.contact(name='Line\nbreak')
+        self.assertFalse(response.json()['success'])
+        self.assertFalse(ContactMessage.objects.exists())
 
-# Create your tests here.
+        with mock.patch('agents.views.queue_email', side_effect=RuntimeError('secret detail')), self.assertLogs('agents.views', 'ERROR'):
+            response = self.contact()
+        self.assertNotIn('secret detail', response.json()['message'])
+        self.assertFalse(ContactMessage.objects.exists())
+        self.assertFalse(OutboundEmail.objects.exists())
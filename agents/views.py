@@ -21,10 +21,15 @@ def agents_list(request):
 
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse
-from django.core.mail import send_mail, BadHeaderError
+from django.core.mail import BadHeaderError
 from django.conf import settings
+from django.db import transaction
+import logging
+from accounts.outbox import queue_email
 from .models import Agent, ContactMessage
 
+logger = logging.getLogger(__name__)
+
 def contact_agent(request, agent_id):
     agent = get_object_or_404(Agent, id=agent_id, is_active=True)
 
@@ -38,20 +43,7 @@ def contact_agent(request, agent_id):
         message_text = request.POST.get('message')
         newsletter = request.POST.get('newsletter') == 'on'
 
-        # Save to database
-        contact_message = ContactMessage.objects.create(
-            agent=agent,
-            name=name,
-            email=email,
-            phone=phone,
-            property_type=property_type,
-            location=location,
-            budget=budget,
-            message=message_text,
-            newsletter=newsletter
-        )
-
-        # Send email notification
+        # Email notification
         subject = f"New Inquiry from {name} for {agent.name}"
         message_body = f"""
         You have received a new message from your contact form:
@@ -68,18 +60,26 @@ def contact_agent(request, agent_id):
         {message_text}
         """
 
+        # The message is saved if and only if its email is queued
         try:
-            send_mail(
-                subject,
-                message_body,
-                settings.DEFAULT_FROM_EMAIL,
-                [agent.email, settings.DEFAULT_FROM_EMAIL],
-                fail_silently=False,
-            )
-            return JsonResponse({'success': True, 'message': 'Message sent successfully!'})
+            with transaction.atomic():
+                ContactMessage.objects.create(
+                    agent=agent,
+                    name=name,
+                    email=email,
+                    phone=phone,
+                    property_type=property_type,
+                    location=location,
+                    budget=budget,
+                    message=message_text,
+                    newsletter=newsletter
+                )
+                queue_email(subject, message_body, [agent.email, settings.DEFAULT_FROM_EMAIL])
         except BadHeaderError:
             return JsonResponse({'success': False, 'message': 'Invalid email header found.'})
-        except Exception as e:
-            return JsonResponse({'success': False, 'message': str(e)})
+        except Exception:
+            logger.exception("Saving a contact message for agent %s failed", agent.id)
+            return JsonResponse({'success': False, 'message': 'Your message could not be sent. Please try again later.'})
+        return JsonResponse({'success': True, 'message': 'Message sent successfully!'})
 
     return render(request, 'agents/contact_agent.html', {'agent': agent})
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BlogCategory, BlogTag, BlogPost, BlogNewsletterSubscriber, BlogComment
+from .models import BlogCategory, BlogTag, BlogPost, BlogNewsletterSubscriber, BlogComment, NewsletterCampaign, NewsletterDelivery
 
 @admin.register(BlogCategory)
 class BlogCategoryAdmin(admin.ModelAdmin):
@@ -29,6 +29,21 @@ class BlogNewsletterSubscriberAdmin(admin.ModelAdmin):
     list_filter = ['is_active', 'subscribed_date']
     search_fields = ['email']
 
+@admin.register(NewsletterCampaign)
+class NewsletterCampaignAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['text_body', 'html_body', 'created_at', 'finished_at']
+    filter_horizontal = ['posts']
+
+@admin.register(NewsletterDelivery)
+class NewsletterDeliveryAdmin(admin.ModelAdmin):
+    list_display = ['email', 'campaign', 'status', 'sent_at']
+    list_filter = ['status', 'campaign']
+    search_fields = ['email']
+    list_select_related = ['campaign']
+    show_full_result_count = False
+
 @admin.register(BlogComment)
 class BlogCommentAdmin(admin.ModelAdmin):
     list_display = ['name', 'email', 'post', 'created_date', 'approved']
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.models import NewsletterCampaign
+from blog.newsletter import create_campaign, queue_recipients, send_campaign
+
+
+class Command(BaseCommand):
+    help = "Send the blog digest, or resume the last unfinished campaign"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help="Include posts published in the last N days")
+        parser.add_argument('--subject', help="Subject line for a new campaign")
+        parser.add_argument('--campaign', type=int, help="Resume this campaign instead of the latest unfinished one")
+        parser.add_argument('--new', action='store_true', help="Start a new campaign even if one is unfinished")
+        parser.add_argument('--retry-failed', action='store_true', help="Send again to addresses that failed (latest campaign unless --campaign)")
+        parser.add_argument('--workers', type=int, help="Concurrent senders (NEWSLETTER_WORKERS)")
+        parser.add_argument('--rate', type=float, help="Messages per second across all senders (NEWSLETTER_SEND_RATE)")
+
+    def handle(self, *args, **options):
+        if options['campaign']:
+            campaign = NewsletterCampaign.objects.filter(pk=options['campaign']).first()
+            if campaign is None:
+                raise CommandError(f"No campaign {options['campaign']}")
+        elif options['retry_failed']:
+            campaign = NewsletterCampaign.objects.first()
+            if campaign is None:
+                raise CommandError("No campaign to retry")
+        elif not options['new'] and (campaign := NewsletterCampaign.objects.filter(status='sending').first()):
+            self.stdout.write(f"Resuming campaign {campaign.pk}: {campaign.subject}")
+        else:
+            campaign = create_campaign(subject=options['subject'], days=options['days'])
+            if campaign is None:
+                self.stdout.write("No posts published in that period, nothing to send.")
+                return
+
+        if options['retry_failed'] and campaign.deliveries.filter(status='failed').update(status='pending', error=''):
+            campaign.status = 'sending'
+            campaign.save(update_fields=['status'])
+        total = queue_recipients(campaign)
+        sent, failed = send_campaign(campaign, workers=options['workers'], rate=options['rate'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Campaign {campaign.pk}: sent {sent} of {total} recipients this run ({failed} failed)"
+        ))
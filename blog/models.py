@@ -84,6 +84,55 @@ class BlogNewsletterSubscriber(models.Model):
     def __str__(self):
         return self.email
 
+class NewsletterCampaign(models.Model):
+    """A digest rendered once; personal fields are filled in per recipient by blog.newsletter."""
+    STATUS_CHOICES = (
+        ('sending', 'Sending'),
+        ('done', 'Done'),
+    )
+
+    subject = models.CharField(max_length=200)
+    posts = models.ManyToManyField(BlogPost, related_name='campaigns', blank=True)
+    text_body = models.TextField()
+    html_body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='sending')
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.subject
+
+
+class NewsletterDelivery(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    )
+
+    campaign = models.ForeignKey(NewsletterCampaign, on_delete=models.CASCADE, related_name='deliveries')
+    email = models.EmailField()
+    name = models.CharField(max_length=150, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = "Newsletter Deliveries"
+        constraints = [
+            # One row per address per campaign, so resuming never sends twice
+            models.UniqueConstraint(fields=['campaign', 'email'], name='newsletter_delivery_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['campaign', 'status', 'id'], name='newsletter_delivery_todo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.email} ({self.status})"
+
 class BlogComment(models.Model):
     post = models.ForeignKey(BlogPost, on_delete=models.CASCADE, related_name='comments')
     name = models.CharField(max_length=100)
@@ -0,0 +1,212 @@
+"""
+Blog digest campaigns.
+
+``create_campaign`` renders the digest templates once, with placeholder
+tokens where per-recipient values go, and stores the result on a
+NewsletterCampaign. ``queue_recipients`` streams active
+BlogNewsletterSubscriber rows and opted-in users with ``iterator()`` and
+inserts one NewsletterDelivery per address; the unique constraint makes
+this safe to repeat. ``send_campaign`` then walks the pending deliveries
+in id order, fills in the tokens with ``str.replace`` and hands the
+messages to a thread pool whose workers share a rate limiter and each
+keep their own backend connection, reconnecting once if a send fails on
+it. Every delivery is marked sent or
+failed as soon as its worker reports back, so an interrupted campaign
+picks up where it stopped when run again.
+"""
+import html
+import logging
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import BlogNewsletterSubscriber, BlogPost, NewsletterCampaign, NewsletterDelivery
+
+logger = logging.getLogger(__name__)
+
+RECIPIENT_CHUNK_SIZE = 1000
+SEND_CHUNK_SIZE = 200
+# Rendered into the templates in place of per-recipient values
+TOKENS = {
+    'name': '%%RECIPIENT_NAME%%',
+    'email': '%%RECIPIENT_EMAIL%%',
+}
+
+
+def digest_posts(days=7):
+    since = timezone.now() - timedelta(days=days)
+    return list(
+        BlogPost.objects.filter(status='published', published_date__gte=since, published_date__lte=timezone.now())
+        .select_related('author').order_by('-published_date')
+    )
+
+
+def create_campaign(subject=None, days=7):
+    """Render a digest of the last ``days`` of posts; returns None if there is nothing to send."""
+    posts = digest_posts(days)
+    if not posts:
+        return None
+    context = {
+        'posts': posts,
+        'site_url': getattr(settings, 'SITE_URL', '').rstrip('/'),
+        'recipient_name': TOKENS['name'],
+        'recipient_email': TOKENS['email'],
+    }
+    campaign = NewsletterCampaign.objects.create(
+        subject=subject or f"DreamHomes Blog: {posts[0].title}",
+        text_body=render_to_string('blog/newsletter_digest.txt', context),
+        html_body=render_to_string('blog/newsletter_digest.html', context),
+    )
+    campaign.posts.set(posts)
+    return campaign
+
+
+def personalize(body, delivery, escape=False):
+    values = {'name': delivery.name or 'there', 'email': delivery.email}
+    for field, token in TOKENS.items():
+        body = body.replace(token, html.escape(values[field]) if escape else values[field])
+    return body
+
+
+def _recipients():
+    """``(email, name)`` for every address that should get the newsletter; may repeat an address."""
+    users = (
+        get_user_model().objects.filter(newsletter_subscription=True, is_active=True)
+        .exclude(email='').values_list('email', 'first_name')
+    )
+    for email, name in users.iterator(chunk_size=RECIPIENT_CHUNK_SIZE):
+        yield email, name
+    subscribers = BlogNewsletterSubscriber.objects.filter(is_active=True).values_list('email', flat=True)
+    for email in subscribers.iterator(chunk_size=RECIPIENT_CHUNK_SIZE):
+        yield email, ''
+
+
+def queue_recipients(campaign):
+    """Create the campaign's pending deliveries; already queued addresses are skipped."""
+    batch = []
+    for email, name in _recipients():
+        batch.append(NewsletterDelivery(campaign=campaign, email=email.strip().lower(), name=name))
+        if len(batch) >= RECIPIENT_CHUNK_SIZE:
+            NewsletterDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    NewsletterDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+    return campaign.deliveries.count()
+
+
+class RateLimiter:
+    """Spaces calls at least ``1 / rate`` seconds apart across all threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class _Sender:
+    """Sends from a worker thread over that thread's own connection."""
+
+    def __init__(self, campaign, rate):
+        self.campaign = campaign
+        self.limiter = RateLimiter(rate)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self):
+        if not hasattr(self._local, 'connection'):
+            self._local.connection = get_connection()
+            # Held open for the whole run rather than per message
+            self._local.connection.open()
+            with self._lock:
+                self._connections.append(self._local.connection)
+        return self._local.connection
+
+    def _drop_connection(self):
+        connection = self._local.connection
+        del self._local.connection
+        with self._lock:
+            self._connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            logger.warning("Closing a newsletter connection failed", exc_info=True)
+
+    def send(self, delivery):
+        message = EmailMultiAlternatives(
+            self.campaign.subject,
+            personalize(self.campaign.text_body, delivery),
+            settings.DEFAULT_FROM_EMAIL,
+            [delivery.email],
+            connection=self.connection(),
+        )
+        message.attach_alternative(personalize(self.campaign.html_body, delivery, escape=True), 'text/html')
+        self.limiter.wait()
+        try:
+            message.send()
+        except (smtplib.SMTPException, OSError):
+            # The server may have dropped a long-held connection; retry once on a fresh one
+            self._drop_connection()
+            message.connection = self.connection()
+            self.limiter.wait()
+            message.send()
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.close()
+            except Exception:
+                logger.warning("Closing a newsletter connection failed", exc_info=True)
+
+
+def send_campaign(campaign, workers=None, rate=None):
+    """Send every pending delivery of ``campaign``; returns (sent, failed) for this run."""
+    workers = workers or getattr(settings, 'NEWSLETTER_WORKERS', 4)
+    rate = rate if rate is not None else getattr(settings, 'NEWSLETTER_SEND_RATE', 10)
+    sender = _Sender(campaign, rate)
+    sent = failed = 0
+    last_id = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='newsletter') as pool:
+            while True:
+                chunk = list(
+                    campaign.deliveries.filter(status='pending', id__gt=last_id)
+                    .order_by('id').only('id', 'email', 'name')[:SEND_CHUNK_SIZE]
+                )
+                if not chunk:
+                    break
+                last_id = chunk[-1].id
+                futures = {pool.submit(sender.send, delivery): delivery for delivery in chunk}
+                # Only the main thread writes, so the workers never touch the database
+                for future in as_completed(futures):
+                    delivery = futures[future]
+                    error = future.exception()
+                    if error is None:
+                        NewsletterDelivery.objects.filter(pk=delivery.pk).update(status='sent', sent_at=timezone.now())
+                        sent += 1
+                    else:
+                        logger.warning("Newsletter to %s failed: %s", delivery.email, error)
+                        NewsletterDelivery.objects.filter(pk=delivery.pk).update(status='failed', error=str(error)[:2000])
+                        failed += 1
+    finally:
+        sender.close()
+    if not campaign.deliveries.filter(status='pending').exists():
+        campaign.status = 'done'
+        campaign.finished_at = timezone.now()
+        campaign.save(update_fields=['status', 'finished_at'])
+    return sent, failed
@@ -1,3 +1,89 @@
+import io
+import smtplib
+import time
+from unittest import mock
+
+from django.core import mail
+from django.core.management import call_command
 from django.test import TestCase
 
-# Create your tests here.
+from accounts.models import CustomUser
+
+from . import newsletter
+from .models import BlogNewsletterSubscriber, BlogPost, NewsletterDelivery
+
+
+class NewsletterCampaignTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        BlogPost.objects.create(title='Buying in Nagpur', slug='buying-in-nagpur', author=author, content='words ' * 50, summary='Guide', status='published')
+        BlogPost.objects.create(title='Draft', slug='draft', author=author, content='draft', summary='Draft')
+        CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x', first_name='Asha', newsletter_subscription=True)
+        for i in range(12):
+            BlogNewsletterSubscriber.objects.create(email=f'sub{i}@example.com')
+        # Also a subscriber, so it must not get the digest twice
+        BlogNewsletterSubscriber.objects.create(email='Reader@example.com')
+        BlogNewsletterSubscriber.objects.create(email='gone@example.com', is_active=False)
+
+    def test_digest_is_rendered_once_and_personalized(self):
+        campaign = newsletter.create_campaign()
+        self.assertEqual(list(campaign.posts.values_list('title', flat=True)), ['Buying in Nagpur'])
+        self.assertEqual(newsletter.queue_recipients(campaign), 13)
+        self.assertEqual(newsletter.queue_recipients(campaign), 13)
+
+        self.assertEqual(newsletter.send_campaign(campaign, workers=3, rate=0), (13, 0))
+        self.assertEqual(len(mail.outbox), 13)
+        self.assertEqual(sorted(len(m.to) for m in mail.outbox), [1] * 13)
+        reader = next(m for m in mail.outbox if m.to == ['reader@example.com'])
+        self.assertIn('Hi Asha', reader.body)
+        self.assertIn('http://localhost:8000/', reader.body)
+        self.assertIn('reader@example.com', reader.alternatives[0][0])
+        campaign.refresh_from_db()
+        self.assertEqual(campaign.status, 'done')
+
+    def test_interrupted_campaign_resumes_without_duplicates(self):
+        campaign = newsletter.create_campaign()
+        newsletter.queue_recipients(campaign)
+        done = list(campaign.deliveries.order_by('id').values_list('id', flat=True)[:5])
+        NewsletterDelivery.objects.filter(id__in=done).update(status='sent')
+
+        original = newsletter._Sender.send
+        def flaky(sender, delivery):
+            if delivery.email == 'sub11@example.com':
+                raise ConnectionError('refused')
+            return original(sender, delivery)
+
+        with mock.patch.object(newsletter._Sender, 'send', flaky), self.assertLogs('blog.newsletter', 'WARNING'):
+            self.assertEqual(newsletter.send_campaign(campaign, rate=0), (7, 1))
+        self.assertNotIn(['sub11@example.com'], [m.to for m in mail.outbox])
+
+        call_command('send_newsletter', '--retry-failed', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 8)
+        self.assertEqual(campaign.deliveries.filter(status='sent').count(), 13)
+
+    def test_dropped_connection_is_replaced_once(self):
+        campaign = newsletter.create_campaign()
+        NewsletterDelivery.objects.create(campaign=campaign, email='one@example.com')
+        dropped, fresh = mock.Mock(), mock.Mock()
+        dropped.send_messages.side_effect = smtplib.SMTPServerDisconnected('gone')
+        fresh.send_messages.return_value = 1
+
+        with mock.patch.object(newsletter, 'get_connection', side_effect=[dropped, fresh]):
+            self.assertEqual(newsletter.send_campaign(campaign, workers=1, rate=0), (1, 0))
+        dropped.close.assert_called_once_with()
+        fresh.close.assert_called_once_with()
+        self.assertEqual(fresh.send_messages.call_count, 1)
+
+        # A second failure on the fresh connection fails the delivery
+        NewsletterDelivery.objects.create(campaign=campaign, email='two@example.com')
+        dropped.send_messages.side_effect = fresh.send_messages.side_effect = smtplib.SMTPServerDisconnected('gone')
+        with mock.patch.object(newsletter, 'get_connection', side_effect=[dropped, fresh]), self.assertLogs('blog.newsletter', 'WARNING'):
+            self.assertEqual(newsletter.send_campaign(campaign, workers=1, rate=0), (0, 1))
+
+    def test_rate_limiter_spaces_sends(self):
+        limiter = newsletter.RateLimiter(rate=200)
+        start = time.monotonic()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.045)
@@ -91,6 +91,22 @@ DATABASES = {
     }
 }
 
+# =============================================================================
+# CACHE
+# =============================================================================
+# Property listing caches are invalidated through a shared version key, so
+# every worker process must use the same cache. LocMem is fine for runserver;
+# point this at Redis/Memcached in a multi-process deployment.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'dreamhomes',
+    }
+}
+
+PROPERTY_LISTING_CACHE_TIMEOUT = 600  # seconds
+
 # =============================================================================
 # AUTHENTICATION
 # =============================================================================
@@ -128,6 +144,48 @@ MEDIA_ROOT = BASE_DIR / 'media'
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 DEFAULT_FROM_EMAIL = 'noreply@dreamhomesrealty.com'
 
+# Views queue mail in accounts.OutboundEmail; `manage.py send_queued_emails --loop`
+# delivers it. Failed sends are retried after 1, 2, 4 ... minutes.
+EMAIL_OUTBOX_RETRY_DELAY = 60
+EMAIL_OUTBOX_MAX_ATTEMPTS = 6
+
+# With EMAIL_BACKEND = 'accounts.mail.PooledSMTPBackend' SMTP connections are
+# reused across sends: up to EMAIL_POOL_SIZE idle connections per server,
+# each dropped after EMAIL_POOL_IDLE_TIMEOUT seconds unused.
+EMAIL_POOL_SIZE = 4
+EMAIL_POOL_IDLE_TIMEOUT = 30
+
+# Newsletter campaigns (`manage.py send_newsletter`): concurrent senders and the
+# combined messages per second they may send. SITE_URL makes links absolute.
+NEWSLETTER_WORKERS = 4
+NEWSLETTER_SEND_RATE = 10
+SITE_URL = 'http://localhost:8000'
+
+# =============================================================================
+# IP GEOLOCATION (property view tracking)
+# =============================================================================
+# Views are buffered in-process and written with one bulk insert every
+# PROPERTY_VIEW_BUFFER_SIZE events or PROPERTY_VIEW_FLUSH_INTERVAL seconds,
+# then resolved in the same background thread through an in-process LRU/TTL cache.
+# Use 'properties.geolocation.OfflineResolver' with a local CSV of IP ranges
+# (ip_from, ip_to, country, region, city, latitude, longitude, isp) to run
+# without network access.
+
+IP_GEOLOCATION_RESOLVER = 'properties.geolocation.IPApiResolver'
+IP_GEOLOCATION_DATABASE = BASE_DIR / 'geoip' / 'ip_ranges.csv'
+IP_GEOLOCATION_TIMEOUT = 2  # seconds
+IP_GEOLOCATION_CACHE_SIZE = 10000
+IP_GEOLOCATION_CACHE_TTL = 60 * 60 * 24  # seconds
+IP_GEOLOCATION_GIVE_UP_HOURS = 24  # save views without geo data once lookups fail past this age
+PROPERTY_VIEW_BUFFER_SIZE = 100
+PROPERTY_VIEW_FLUSH_INTERVAL = 5  # seconds
+
+# Raw views older than this are archived to gzipped CSV (one file per day)
+# and deleted by `manage.py prune_property_views`, after being rolled up
+# into PropertyViewDaily.
+PROPERTY_VIEW_RETENTION_DAYS = 90
+PROPERTY_VIEW_ARCHIVE_DIR = BASE_DIR / 'archive' / 'property_views'
+
 # =============================================================================
 # COMPANY INFO (Hardcoded for simplicity)
 # =============================================================================
@@ -9,7 +9,11 @@ from .models import (
     PropertyAmenity,
     NearbyPlace,
     PropertyView,
+    PropertyViewDaily,
+    PropertyPriceHistory,
 )
+from .rollups import recent_views
+from .renditions import rendition_url
 
 from django.contrib import admin
 from .models import ScheduledVisit
@@ -42,7 +46,7 @@ class PropertyImageInline(admin.TabularInline):
         if obj.image:
             return format_html(
                 '<img src="{}" width="80" height="60" style="object-fit:cover;border-radius:4px;"/>',
-                obj.image.url
+                obj.thumb_url()
             )
         return "No Image"
 
@@ -60,6 +64,17 @@ class NearbyPlaceInline(admin.TabularInline):
     extra = 1
 
 
+class PropertyPriceHistoryInline(admin.TabularInline):
+    model = PropertyPriceHistory
+    extra = 0
+    fields = ("changed_at", "old_price", "new_price")
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
 # -----------------------------
 # MAIN PROPERTY ADMIN
 # -----------------------------
@@ -75,13 +90,14 @@ class PropertyAdmin(admin.ModelAdmin):
         "city",
         "is_active",
         "featured",
+        "views_30d",
         "created_at",
     )
     list_filter = ("status", "type", "custom_type", "featured", "is_active", "city", "created_at")
     search_fields = ("title", "property_id", "location", "description")
     list_editable = ("status", "is_active", "featured")
     readonly_fields = ("property_id", "created_at", "updated_at")
-    inlines = [PropertyImageInline, PropertyAmenityInline, NearbyPlaceInline]
+    inlines = [PropertyImageInline, PropertyAmenityInline, NearbyPlaceInline, PropertyPriceHistoryInline]
     ordering = ("-featured", "-created_at")
     list_per_page = 25
 
@@ -113,15 +129,22 @@ class PropertyAdmin(admin.ModelAdmin):
 
     def thumbnail(self, obj):
         """Show a small primary image beside each property in list view"""
-        primary = obj.images.filter(is_primary=True).first()
-        if primary and primary.image:
+        if obj.primary_image:
             return format_html(
                 '<img src="{}" width="70" height="50" style="object-fit:cover;border-radius:4px;"/>',
-                primary.image.url
+                rendition_url(obj.primary_renditions, 'thumb') or obj.primary_image.url
             )
         return "—"
     thumbnail.short_description = "Image"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(views_30d=recent_views(30))
+
+    def views_30d(self, obj):
+        return obj.views_30d
+    views_30d.short_description = "Views (30d)"
+    views_30d.admin_order_field = "views_30d"
+
     def get_type_display_name(self, obj):
         """Display custom type if set, otherwise fallback to default choice"""
         return obj.custom_type.name if obj.custom_type else obj.get_type_display()
@@ -155,10 +178,23 @@ class AmenityAdmin(admin.ModelAdmin):
 @admin.register(PropertyView)
 class PropertyViewAdmin(admin.ModelAdmin):
     list_display = ("property", "ip_address", "viewed_at")
-    list_filter = ("viewed_at",)
+    list_filter = ("viewed_at", "user_agent__device_type")
     readonly_fields = ("property", "ip_address", "user_agent", "viewed_at")
     search_fields = ("property__title", "ip_address")
     ordering = ("-viewed_at",)
+    list_select_related = ("property",)
+    # Skip the unfiltered COUNT(*) over the whole log on every page
+    show_full_result_count = False
+
+
+@admin.register(PropertyViewDaily)
+class PropertyViewDailyAdmin(admin.ModelAdmin):
+    list_display = ("property", "day", "country", "city", "views")
+    list_filter = ("day", "country")
+    search_fields = ("property__title", "city")
+    date_hierarchy = "day"
+    list_select_related = ("property",)
+    readonly_fields = ("property", "day", "country", "city", "views")
 
 
 @admin.register(SavedProperty)
@@ -0,0 +1,44 @@
+"""
+Versioned caching for the property listing endpoint.
+
+Every cached listing response is stored under a key that embeds the
+current catalogue version. Writes to Property, PropertyImage or
+PropertyAmenity bump the version (see ``properties.signals``), so all
+previously cached pages become unreachable at once and simply expire.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LISTING_VERSION_KEY = 'properties:listing_version'
+LISTING_CACHE_TIMEOUT = getattr(settings, 'PROPERTY_LISTING_CACHE_TIMEOUT', 600)  # seconds
+
+
+def get_listing_version():
+    version = cache.get(LISTING_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1 so a lost version key can never
+        # resurrect entries cached under an older counter
+        version = int(time.time() * 1000)
+        if not cache.add(LISTING_VERSION_KEY, version, None):
+            version = cache.get(LISTING_VERSION_KEY, version)
+    return version
+
+
+def bump_listing_version():
+    try:
+        return cache.incr(LISTING_VERSION_KEY)
+    except ValueError:
+        # Key missing (evicted or never set): any fresh value invalidates
+        version = int(time.time() * 1000)
+        cache.set(LISTING_VERSION_KEY, version, None)
+        return version
+
+
+def listing_cache_key(prefix, params):
+    """Cache key for ``params`` (a dict of normalized values) under the current version."""
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f'properties:{prefix}:v{get_listing_version()}:{digest}'
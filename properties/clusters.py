@@ -0,0 +1,91 @@
+"""
+Server-side clustering of property pins for low map zoom levels.
+
+The viewport is split into geohash tiles whose size follows the zoom
+level. Each tile is aggregated in one GROUP BY over the geohash index,
+one character finer than the tile (32 clusters per tile at most), and
+cached on its own. A Property write only drops the cached tiles that
+contain its old or new position, so panning around an unchanged map
+never touches the database.
+"""
+from django.core.cache import cache
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import Substr
+
+from .geo import cells_at_precision, grid_shape
+from .models import Property
+
+MIN_TILE_PRECISION = 1
+MAX_TILE_PRECISION = 7
+MAX_TILES = 64
+CLUSTER_TILE_TIMEOUT = 60 * 60 * 24  # writes invalidate tiles explicitly
+
+
+def tile_precision(zoom):
+    """Geohash length of a tile at a web-map zoom level (a tile is about a screen tile)."""
+    return max(MIN_TILE_PRECISION, min(MAX_TILE_PRECISION, round(2 * zoom / 5)))
+
+
+def _tile_key(tile):
+    return f'properties:cluster_tile:{tile}'
+
+
+def _aggregate_tile(tile):
+    rows = (
+        Property.objects.filter(is_active=True, geohash__gte=tile, geohash__lt=tile + '~')
+        .annotate(cell=Substr('geohash', 1, len(tile) + 1))
+        .values('cell')
+        .annotate(
+            count=Count('id'),
+            lat=Avg('latitude'),
+            lng=Avg('longitude'),
+            min_price=Min('price'),
+            max_price=Max('price'),
+        )
+        .order_by()
+    )
+    return [
+        {
+            'cell': row['cell'],
+            'count': row['count'],
+            'lat': round(float(row['lat']), 6),
+            'lng': round(float(row['lng']), 6),
+            'min_price': float(row['min_price']),
+            'max_price': float(row['max_price']),
+        }
+        for row in rows
+    ]
+
+
+def clusters_for_viewport(south, west, north, east, zoom):
+    """Clusters of active properties in every tile overlapping the viewport."""
+    precision = tile_precision(zoom)
+    # A viewport far wider than the zoom suggests would mean hundreds of tiles
+    while precision > MIN_TILE_PRECISION:
+        rows, columns = grid_shape(south, west, north, east, precision)
+        if rows * columns <= MAX_TILES:
+            break
+        precision -= 1
+    tiles = cells_at_precision(south, west, north, east, precision)
+
+    cached = cache.get_many([_tile_key(tile) for tile in tiles])
+    clusters, missing = [], {}
+    for tile in tiles:
+        tile_clusters = cached.get(_tile_key(tile))
+        if tile_clusters is None:
+            tile_clusters = missing[_tile_key(tile)] = _aggregate_tile(tile)
+        clusters.extend(tile_clusters)
+    if missing:
+        cache.set_many(missing, CLUSTER_TILE_TIMEOUT)
+    return {'precision': precision, 'tiles': len(tiles), 'clusters': clusters}
+
+
+def invalidate_cluster_tiles(*geohashes):
+    """Drop the cached tiles, at every precision, that contain any of the given positions."""
+    keys = {
+        _tile_key(geohash[:precision])
+        for geohash in geohashes if geohash
+        for precision in range(MIN_TILE_PRECISION, MAX_TILE_PRECISION + 1)
+    }
+    if keys:
+        cache.delete_many(list(keys))
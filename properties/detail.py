@@ -0,0 +1,80 @@
+"""
+Query plan for the property detail page.
+
+Everything the template touches is loaded up front: the agent through a
+join, and images, amenities (with their Amenity rows), nearby places and
+the ranked similar listings through one prefetch query each, so the
+page costs the same handful of queries however much a listing has.
+Similar listings render their image from the ``primary_image`` column,
+which needs no further lookups.
+
+The gallery and the body of the page (highlights, description,
+amenities, specs, location, nearby places) are cached as template
+fragments keyed by the property id and ``updated_at``. Writes to a
+property or its images, amenities and nearby places bump ``updated_at``
+(see ``properties.signals``), so a stale fragment is never looked up
+again. While both fragments are cached their content isn't prefetched.
+"""
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Property, PropertyAmenity, PropertyImage, SimilarProperty
+
+SIMILAR_ON_PAGE = 3
+DETAIL_FRAGMENTS = ('property_gallery', 'property_body')
+# Keys change with every edit, so the timeout only bounds how long dead entries linger
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+
+def detail_queryset():
+    return (
+        Property.objects.filter(is_active=True)
+        .select_related('agent')
+        .prefetch_related(
+            Prefetch(
+                'similar_links',
+                queryset=SimilarProperty.objects.filter(similar__is_active=True).select_related('similar').order_by('rank'),
+                to_attr='ranked_similar',
+            ),
+        )
+    )
+
+
+def _fragment_cache():
+    # Same lookup as the {% cache %} tag
+    try:
+        return caches['template_fragments']
+    except InvalidCacheBackendError:
+        return caches['default']
+
+
+def fragments_cached(property_obj):
+    keys = [
+        make_template_fragment_key(name, [property_obj.id, property_obj.updated_at])
+        for name in DETAIL_FRAGMENTS
+    ]
+    return len(_fragment_cache().get_many(keys)) == len(keys)
+
+
+def load_fragment_content(property_obj):
+    """Prefetch what the cached fragments render, unless they are all cached already."""
+    if fragments_cached(property_obj):
+        return
+    prefetch_related_objects(
+        [property_obj],
+        Prefetch('images', queryset=PropertyImage.objects.order_by('order', 'id'), to_attr='prefetched_gallery'),
+        Prefetch('amenities', queryset=PropertyAmenity.objects.select_related('amenity')),
+        'nearby_places',
+    )
+
+
+def similar_properties(property_obj):
+    """Precomputed neighbours; the plain filter covers listings the recommendation job has not reached yet."""
+    similar = [link.similar for link in property_obj.ranked_similar[:SIMILAR_ON_PAGE]]
+    if similar:
+        return similar
+    return list(
+        Property.objects.filter(is_active=True, type=property_obj.type, status=property_obj.status)
+        .exclude(id=property_obj.id)[:SIMILAR_ON_PAGE]
+    )
@@ -0,0 +1,143 @@
+"""
+Spatial lookups over Property.latitude/longitude.
+
+Each property stores the geohash of its coordinates in an indexed
+column. A bounding box is turned into the handful of geohash cells that
+cover it, and every cell becomes a range scan on that index, so a
+viewport or radius query only reads rows in the area instead of
+computing a distance for every listing.
+"""
+import math
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9  # roughly 5 m x 5 m cells
+KM_PER_DEGREE = 111.195
+MAX_COVERING_CELLS = 16
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Standard base32 geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (target[0] + target[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            target[0] = middle
+        else:
+            target[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell of the given precision."""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def _clamp_box(south, west, north, east):
+    return max(south, -90.0), max(west, -180.0), min(north, 90.0), min(east, 180.0)
+
+
+def grid_shape(south, west, north, east, precision):
+    height, width = cell_size(precision)
+    rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+    columns = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+    return rows, columns
+
+
+def cells_at_precision(south, west, north, east, precision):
+    """All geohash cells of the given precision that overlap the box."""
+    south, west, north, east = _clamp_box(south, west, north, east)
+    height, width = cell_size(precision)
+    rows, columns = grid_shape(south, west, north, east, precision)
+    cells = set()
+    for row in range(rows):
+        latitude = min(south + row * height, north)
+        for column in range(columns):
+            longitude = min(west + column * width, east)
+            cells.add(encode(latitude, longitude, precision))
+    # The far edges can fall into the next cell when the box isn't aligned
+    cells.add(encode(north, east, precision))
+    cells.add(encode(north, west, precision))
+    cells.add(encode(south, east, precision))
+    return sorted(cells)
+
+
+def covering_cells(south, west, north, east, max_cells=MAX_COVERING_CELLS):
+    """The finest set of at most ``max_cells`` geohash prefixes covering the box."""
+    box = _clamp_box(south, west, north, east)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        rows, columns = grid_shape(*box, precision)
+        if rows * columns <= max_cells:
+            return cells_at_precision(*box, precision)
+    return ['']
+
+
+def parse_bbox(value):
+    """
+    ``(south, west, north, east)`` from a ``"south,west,north,east"`` string.
+
+    Raises ValueError unless all four are finite, in latitude/longitude
+    range and ordered south <= north, west <= east.
+    """
+    south, west, north, east = bbox = tuple(float(part) for part in value.split(','))
+    if not all(math.isfinite(part) for part in bbox):
+        raise ValueError("bbox coordinates must be finite")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= east <= 180):
+        raise ValueError("bbox is out of range or not ordered")
+    return bbox
+
+
+def bbox_q(south, west, north, east):
+    """Condition selecting properties inside the bounding box, driven by the geohash index."""
+    cells = Q()
+    for prefix in covering_cells(south, west, north, east):
+        if prefix:
+            # A prefix range; unlike LIKE 'prefix%' this can use the index on SQLite
+            cells |= Q(geohash__gte=prefix, geohash__lt=prefix + '~')
+        else:
+            cells |= ~Q(geohash='')
+    return cells & Q(
+        latitude__gte=south, latitude__lte=north,
+        longitude__gte=west, longitude__lte=east,
+    )
+
+
+def bbox_around(latitude, longitude, radius_km):
+    """Bounding box (south, west, north, east) of a circle."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - lat_delta, longitude - lng_delta, latitude + lat_delta, longitude + lng_delta
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """
+    Narrow ``queryset`` to properties within ``radius_km`` of a point and
+    annotate ``distance_sq`` (squared km, usable for ordering).
+
+    Uses the equirectangular approximation, which is well within a
+    percent at city scale and needs only arithmetic the database can do.
+    """
+    scale = math.cos(math.radians(latitude))
+    dy = Cast(F('latitude'), FloatField()) - latitude
+    dx = (Cast(F('longitude'), FloatField()) - longitude) * scale
+    distance_sq = (dx * dx + dy * dy) * (KM_PER_DEGREE ** 2)
+    return (
+        queryset.filter(bbox_q(*bbox_around(latitude, longitude, radius_km)))
+        .annotate(distance_sq=distance_sq)
+        .filter(distance_sq__lte=radius_km ** 2)
+    )
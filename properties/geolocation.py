@@ -0,0 +1,214 @@
+"""
+IP geolocation for property view tracking.
+
+Lookups go through a pluggable resolver (``IP_GEOLOCATION_RESOLVER``)
+wrapped in an in-process LRU cache with a TTL, keyed by network prefix
+(/24 for IPv4, /48 for IPv6) since neighbouring addresses geolocate the
+same. ``IPApiResolver`` calls ipapi.co with a timeout; ``OfflineResolver``
+reads a local CSV of IP ranges for tests and air-gapped deployments.
+A resolver returns ``{}`` for an address it has no data for and None
+when the lookup itself failed; failures are not cached and the view
+stays unresolved so a later run retries it. Once a view is older than
+``IP_GEOLOCATION_GIVE_UP_HOURS`` a failed lookup saves it without geo
+data instead, so one bad address cannot hold up the rollup (and with
+it retention) for good.
+
+Views never resolve inline: the view buffer in ``properties.tracking``
+geolocates rows in its background flush. Rows it never got to are
+picked up by the ``geolocate_property_views`` management command.
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+GEO_FIELDS = ('country', 'region', 'city', 'latitude', 'longitude', 'isp')
+
+
+class IPApiResolver:
+    """Resolve through the ipapi.co JSON API."""
+
+    url = 'https://ipapi.co/{ip}/json/'
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or getattr(settings, 'IP_GEOLOCATION_TIMEOUT', 2)
+
+    def resolve(self, ip_address):
+        try:
+            response = requests.get(self.url.format(ip=ip_address), timeout=self.timeout)
+            if response.status_code == 200:
+                data = response.json()
+                if data.get('error'):
+                    # Reserved or unknown address: a definite "no data"
+                    return {}
+                return {
+                    'country': data.get('country_name'),
+                    'region': data.get('region'),
+                    'city': data.get('city'),
+                    'latitude': data.get('latitude'),
+                    'longitude': data.get('longitude'),
+                    'isp': data.get('org'),
+                }
+            logger.warning("IP lookup for %s returned HTTP %s", ip_address, response.status_code)
+        except Exception:
+            logger.warning("IP lookup failed for %s", ip_address, exc_info=True)
+        return None
+
+
+class OfflineResolver:
+    """
+    Resolve from a local CSV of address ranges with the columns
+    ``ip_from, ip_to, country, region, city, latitude, longitude, isp``.
+    Addresses may be dotted/colon notation or integers.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'IP_GEOLOCATION_DATABASE', None)
+        if not self.path:
+            raise ImproperlyConfigured("OfflineResolver needs IP_GEOLOCATION_DATABASE to point at a CSV file")
+        try:
+            self._load()
+        except (OSError, KeyError, ValueError) as exc:
+            raise ImproperlyConfigured(f"Cannot read IP geolocation database {self.path}: {exc!r}") from exc
+
+    def _load(self):
+        ranges = []
+        with open(self.path, newline='', encoding='utf-8') as handle:
+            for row in csv.DictReader(handle):
+                start = int(ipaddress.ip_address(_as_address(row['ip_from'])))
+                end = int(ipaddress.ip_address(_as_address(row['ip_to'])))
+                ranges.append((start, end, {
+                    'country': row.get('country') or None,
+                    'region': row.get('region') or None,
+                    'city': row.get('city') or None,
+                    'latitude': float(row['latitude']) if row.get('latitude') else None,
+                    'longitude': float(row['longitude']) if row.get('longitude') else None,
+                    'isp': row.get('isp') or None,
+                }))
+        ranges.sort(key=lambda item: item[0])
+        self._ranges = ranges
+        self._starts = [start for start, _, _ in ranges]
+
+    def resolve(self, ip_address):
+        value = int(ipaddress.ip_address(ip_address))
+        position = bisect.bisect_right(self._starts, value) - 1
+        if position >= 0:
+            start, end, data = self._ranges[position]
+            if start <= value <= end:
+                return dict(data)
+        return {}
+
+
+class CachedResolver:
+    """LRU + TTL cache in front of another resolver, keyed by network prefix."""
+
+    def __init__(self, resolver, maxsize=10000, ttl=60 * 60 * 24):
+        self.resolver = resolver
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(ip_address):
+        address = ipaddress.ip_address(ip_address)
+        prefix = 24 if address.version == 4 else 48
+        return str(ipaddress.ip_network(f'{address}/{prefix}', strict=False))
+
+    def resolve(self, ip_address):
+        key = self.cache_key(ip_address)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return dict(entry[1])
+
+        data = self.resolver.resolve(ip_address)
+        if data is None:
+            # Let the next lookup try again instead of caching the outage
+            return None
+        with self._lock:
+            self._entries[key] = (now + self.ttl, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return dict(data)
+
+
+def _as_address(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else value
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        with _resolver_lock:
+            if _resolver is None:
+                resolver_class = import_string(
+                    getattr(settings, 'IP_GEOLOCATION_RESOLVER', 'properties.geolocation.IPApiResolver')
+                )
+                _resolver = CachedResolver(
+                    resolver_class(),
+                    maxsize=getattr(settings, 'IP_GEOLOCATION_CACHE_SIZE', 10000),
+                    ttl=getattr(settings, 'IP_GEOLOCATION_CACHE_TTL', 60 * 60 * 24),
+                )
+    return _resolver
+
+
+def lookup(ip_address):
+    """Geolocation fields for an address; empty for private or malformed addresses, None if the lookup failed."""
+    try:
+        address = ipaddress.ip_address(ip_address)
+    except ValueError:
+        return {}
+    if not address.is_global:
+        return {}
+    return get_resolver().resolve(ip_address)
+
+
+def give_up_cutoff():
+    """Views last seen before this are saved without geo data when their lookup fails."""
+    return timezone.now() - timedelta(hours=getattr(settings, 'IP_GEOLOCATION_GIVE_UP_HOURS', 24))
+
+
+def geolocate_views(views):
+    """Fill in and save the geo fields of ``views``; returns how many were resolved.
+
+    Views whose lookup failed keep ``geo_resolved=False`` for the next run,
+    unless they are older than ``give_up_cutoff()``.
+    """
+    from .models import PropertyView
+
+    give_up = give_up_cutoff()
+    resolved = []
+    for view in views:
+        data = lookup(view.ip_address)
+        if data is None:
+            if view.viewed_at > give_up:
+                continue
+            logger.warning("Giving up geolocating view %s from %s", view.pk, view.ip_address)
+            data = {}
+        for field in GEO_FIELDS:
+            setattr(view, field, data.get(field))
+        view.geo_resolved = True
+        resolved.append(view)
+    PropertyView.objects.bulk_update(resolved, [*GEO_FIELDS, 'geo_resolved'])
+    return len(resolved)
@@ -0,0 +1,258 @@
+"""
+Query building for the property listing endpoint (``get_properties``).
+
+Kept separate from the view so the same filter/sort logic can be reused
+by management commands that inspect or warm the listing queries.
+"""
+import base64
+import json
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import LISTING_CACHE_TIMEOUT, listing_cache_key
+from .geo import within_radius
+from .models import Property
+from .search import search_properties
+
+PAGE_SIZE = 9
+
+PRICE_RANGES = {
+    '0-20': (0, 2000000),
+    '20-40': (2000000, 4000000),
+    '40-60': (4000000, 6000000),
+    '60-100': (6000000, 10000000),
+    '100-999': (10000000, 999999999)
+}
+
+# Values of the bedrooms filter; '4' means four or more
+BEDROOM_BUCKETS = ('1', '2', '3', '4')
+
+# Every ordering ends on the primary key so it is total, which keyset
+# (cursor) pagination relies on
+SORT_ORDERINGS = {
+    'newest': ('-created_at', '-id'),
+    'price-low': ('price', 'id'),
+    'price-high': ('-price', '-id'),
+    'name': ('title', 'id'),
+}
+RANK_ORDERING = ('-search_rank', '-id')
+DISTANCE_ORDERING = ('distance_sq', 'id')
+# Sort keys that are query annotations rather than model fields
+ANNOTATED_SORT_KEYS = {'search_rank', 'distance_sq'}
+
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 100
+
+
+def sort_ordering(sort_by, search_query='', near=None):
+    if sort_by == 'rank' and search_query:
+        return RANK_ORDERING
+    if sort_by == 'distance' and near:
+        return DISTANCE_ORDERING
+    return SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS['newest'])
+
+
+def _parse_near(params):
+    """``[lat, lng, radius_km]`` from ``?lat=&lng=&radius=``, or None."""
+    try:
+        latitude = float(params['lat'])
+        longitude = float(params['lng'])
+        radius = float(params.get('radius') or DEFAULT_RADIUS_KM)
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and radius > 0):
+        return None
+    return [round(latitude, 5), round(longitude, 5), round(min(radius, MAX_RADIUS_KM), 3)]
+
+
+def normalize_filters(params):
+    """
+    Read the listing filters from request parameters in a canonical form,
+    so equivalent requests share cache entries.
+    """
+    price_range = params.get('price', 'all')
+    sort_by = params.get('sort', 'newest')
+    search_query = ' '.join(params.get('search', '').split()).lower()
+    location = params.get('location', 'all').strip().lower() or 'all'
+    near = _parse_near(params)
+    sort_allowed = sort_by in SORT_ORDERINGS or (sort_by == 'rank' and search_query) or (sort_by == 'distance' and near)
+    return {
+        'status': params.get('status', 'all') or 'all',
+        'property_type': params.get('type', 'all') or 'all',
+        'location': location,
+        'bedrooms': params.get('bedrooms', 'all') or 'all',
+        'price_range': price_range if price_range in PRICE_RANGES else 'all',
+        'search_query': search_query,
+        'sort_by': sort_by if sort_allowed else 'newest',
+        'near': near,
+    }
+
+
+def _bedrooms_q(bedrooms):
+    if bedrooms == '4':
+        return Q(bedrooms__gte=4)
+    return Q(bedrooms=bedrooms)
+
+
+def _price_q(price_range):
+    min_price, max_price = PRICE_RANGES[price_range]
+    return Q(price__gte=min_price, price__lte=max_price)
+
+
+def facet_conditions(status='all', property_type='all', bedrooms='all', price_range='all'):
+    """Filter conditions for the faceted dimensions, keyed by facet name."""
+    conditions = {}
+    if status != 'all':
+        conditions['status'] = Q(status=status)
+    if property_type != 'all':
+        conditions['type'] = Q(type=property_type)
+    if bedrooms != 'all':
+        conditions['bedrooms'] = _bedrooms_q(bedrooms)
+    if price_range in PRICE_RANGES:
+        conditions['price'] = _price_q(price_range)
+    return conditions
+
+
+def base_properties(location='all', search_query='', near=None):
+    """Active properties narrowed by the non-faceted filters (location, search and radius)."""
+    properties = Property.objects.filter(is_active=True)
+
+    if near:
+        properties = within_radius(properties, *near)
+
+    if location != 'all':
+        properties = properties.filter(location__icontains=location)
+
+    if search_query:
+        properties = search_properties(properties, search_query)
+
+    return properties
+
+
+def filter_properties(status='all', property_type='all', location='all', bedrooms='all',
+                      price_range='all', search_query='', sort_by='newest', near=None):
+    """Return the ordered queryset of active properties matching the listing filters."""
+    properties = base_properties(location, search_query, near)
+    for condition in facet_conditions(status, property_type, bedrooms, price_range).values():
+        properties = properties.filter(condition)
+    return properties.order_by(*sort_ordering(sort_by, search_query, near))
+
+
+def facet_counts(status='all', property_type='all', location='all', bedrooms='all',
+                 price_range='all', search_query='', sort_by='newest', near=None):
+    """
+    Count matching properties per status, type, bedrooms bucket and price range.
+
+    Each facet applies every active filter except its own, so the counts say
+    how many results picking that value would give. All of it is computed
+    in a single query of conditional aggregates.
+    """
+    conditions = facet_conditions(status, property_type, bedrooms, price_range)
+    facet_values = {
+        'status': {code: Q(status=code) for code, _ in Property.STATUS_CHOICES},
+        'type': {code: Q(type=code) for code, _ in Property.TYPE_CHOICES},
+        'bedrooms': {value: _bedrooms_q(value) for value in BEDROOM_BUCKETS},
+        'price': {value: _price_q(value) for value in PRICE_RANGES},
+    }
+
+    aggregates, labels = {}, {}
+    for facet, values in facet_values.items():
+        others = Q()
+        for name, condition in conditions.items():
+            if name != facet:
+                others &= condition
+        for value, condition in values.items():
+            alias = f'facet_{len(aggregates)}'
+            aggregates[alias] = Count('id', filter=condition & others)
+            labels[alias] = (facet, value)
+
+    counts = {facet: {} for facet in facet_values}
+    totals = base_properties(location, search_query, near).order_by().aggregate(**aggregates)
+    for alias, total in totals.items():
+        facet, value = labels[alias]
+        counts[facet][value] = total
+    return counts
+
+
+def _cursor_value(obj, field_name):
+    value = getattr(obj, field_name)
+    if field_name in ANNOTATED_SORT_KEYS:
+        return value
+    return Property._meta.get_field(field_name).value_to_string(obj) if value is not None else None
+
+
+def encode_cursor(obj, ordering):
+    """Opaque cursor holding the sort key values of ``obj`` for ``ordering``."""
+    values = [_cursor_value(obj, field.lstrip('-')) for field in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, ordering):
+    """Inverse of ``encode_cursor``. Raises ValueError for a malformed cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise ValueError("Invalid cursor")
+
+    decoded = []
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        if name in ANNOTATED_SORT_KEYS:
+            try:
+                decoded.append(float(value))
+            except (TypeError, ValueError) as exc:
+                raise ValueError("Invalid cursor") from exc
+        else:
+            try:
+                decoded.append(Property._meta.get_field(name).to_python(value))
+            except Exception as exc:
+                raise ValueError("Invalid cursor") from exc
+    return decoded
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """
+    Return ``(items, next_cursor)`` for the page after ``cursor``.
+
+    Pages by comparing against the last seen sort key instead of using
+    OFFSET, so every page costs the same as the first one.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, ordering)
+        # (a, b, c) > (x, y, z)  <=>  a > x OR (a = x AND b > y) OR ...
+        condition = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[i]})
+            for previous, value in zip(ordering[:i], values[:i]):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        queryset = queryset.filter(condition)
+
+    items = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(items) > page_size:
+        items = items[:page_size]
+        next_cursor = encode_cursor(items[-1], ordering)
+    return items, next_cursor
+
+
+def approximate_total(queryset, filters):
+    """
+    COUNT of ``queryset``, cached under the filter values until the next
+    catalogue write.
+
+    Good enough for "about N results" in infinite-scroll clients without
+    paying for a COUNT(*) on every page.
+    """
+    key = listing_cache_key('approximate_total', filters)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.order_by().count()
+        cache.set(key, total, LISTING_CACHE_TIMEOUT)
+    return total
@@ -0,0 +1,51 @@
+"""
+Cached dictionary of listing locations with active-listing counts.
+
+Backs the location dropdowns on the home and property list pages, which
+would otherwise run a DISTINCT query over all active properties on every
+view. The dictionary is built once and then kept current by
+``refresh_locations`` from the Property signals, which recounts only the
+locations touched by a write.
+"""
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Property
+
+LOCATIONS_KEY = 'properties:location_counts'
+# Incremental refreshes keep it current; the timeout only bounds drift
+LOCATIONS_TIMEOUT = 60 * 60 * 24
+
+
+def _active_properties():
+    return Property.objects.filter(is_active=True).exclude(location='')
+
+
+def location_counts():
+    """Return ``{location: number of active listings}``."""
+    counts = cache.get(LOCATIONS_KEY)
+    if counts is None:
+        rows = _active_properties().values('location').annotate(count=Count('id')).order_by()
+        counts = {row['location']: row['count'] for row in rows}
+        cache.set(LOCATIONS_KEY, counts, LOCATIONS_TIMEOUT)
+    return counts
+
+
+def sorted_locations():
+    return sorted(location_counts())
+
+
+def refresh_locations(*locations):
+    """Recount the given locations in the cached dictionary, if it is built."""
+    counts = cache.get(LOCATIONS_KEY)
+    if counts is None:
+        return
+    names = {location for location in locations if location}
+    rows = _active_properties().filter(location__in=names).values('location').annotate(count=Count('id')).order_by()
+    fresh = {row['location']: row['count'] for row in rows}
+    for name in names:
+        if fresh.get(name):
+            counts[name] = fresh[name]
+        else:
+            counts.pop(name, None)
+    cache.set(LOCATIONS_KEY, counts, LOCATIONS_TIMEOUT)
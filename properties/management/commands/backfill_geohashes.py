@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from properties.cache import bump_listing_version
+from properties.clusters import invalidate_cluster_tiles
+from properties.models import Property
+
+
+class Command(BaseCommand):
+    help = "Populate Property.geohash from latitude/longitude"
+
+    def handle(self, *args, **options):
+        stale = []
+        touched = set()
+        for property_obj in Property.objects.only('pk', 'latitude', 'longitude', 'geohash').iterator():
+            geohash = property_obj.compute_geohash()
+            if geohash != property_obj.geohash:
+                touched.update((property_obj.geohash, geohash))
+                property_obj.geohash = geohash
+                stale.append(property_obj)
+
+        Property.objects.bulk_update(stale, ['geohash'], batch_size=500)
+        # bulk_update sends no signals, so drop what they would have
+        if stale:
+            invalidate_cluster_tiles(*touched)
+            bump_listing_version()
+        self.stdout.write(self.style.SUCCESS(f"✅ Updated geohash for {len(stale)} properties"))
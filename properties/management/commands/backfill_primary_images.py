@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from properties.models import Property
+
+
+class Command(BaseCommand):
+    help = "Populate the cached Property.primary_image column from PropertyImage rows"
+
+    def handle(self, *args, **options):
+        updated = 0
+        for property_obj in Property.objects.only('pk', 'primary_image').iterator():
+            previous = property_obj.primary_image.name
+            property_obj.refresh_primary_image()
+            if property_obj.primary_image.name != previous:
+                updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Backfilled primary image for {updated} properties"))
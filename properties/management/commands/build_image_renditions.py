@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from properties.models import PropertyImage
+from properties.renditions import build_renditions
+
+
+class Command(BaseCommand):
+    help = "Generate WebP/AVIF renditions for property images that are missing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Rebuild renditions for every image")
+
+    def handle(self, *args, **options):
+        images = PropertyImage.objects.exclude(image='').values_list('pk', 'image', 'renditions')
+        built = 0
+        for image_id, name, renditions in images.iterator():
+            if not options['all'] and (renditions or {}).get('source') == name:
+                continue
+            try:
+                built += build_renditions(image_id)
+            except (OSError, ValueError) as exc:
+                self.stderr.write(f"Skipping image {image_id}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Built renditions for {built} images"))
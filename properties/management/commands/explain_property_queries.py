@@ -0,0 +1,62 @@
+import itertools
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+
+from properties.listing import PRICE_RANGES, SORT_ORDERINGS, filter_properties
+from properties.models import Property
+
+# Plan lines that mean the whole properties table is read row by row
+FULL_SCAN_PATTERNS = [
+    re.compile(r'\bSCAN properties_property\b(?! USING)'),  # SQLite
+    re.compile(r'\bSeq Scan on properties_property\b'),  # PostgreSQL
+]
+# Walking an index end to end only pays off if it also yields the sort order
+INDEX_SCAN_PATTERN = re.compile(r'\bSCAN properties_property USING INDEX\b')
+TEMP_SORT_PATTERN = re.compile(r'\bUSE TEMP B-TREE FOR ORDER BY\b')
+
+
+def is_full_scan(plan):
+    if any(pattern.search(plan) for pattern in FULL_SCAN_PATTERNS):
+        return True
+    return bool(INDEX_SCAN_PATTERN.search(plan) and TEMP_SORT_PATTERN.search(plan))
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN over every get_properties filter/sort combination and fail "
+        "if any of them falls back to a full table scan"
+    )
+
+    def handle(self, *args, **options):
+        statuses = ['all'] + [code for code, _ in Property.STATUS_CHOICES]
+        types = ['all'] + [code for code, _ in Property.TYPE_CHOICES]
+        bedrooms = ['all', '1', '2', '3', '4']
+        prices = ['all'] + list(PRICE_RANGES)
+        sorts = list(SORT_ORDERINGS)
+
+        failures = []
+        checked = 0
+        for status, property_type, beds, price, sort_by in itertools.product(statuses, types, bedrooms, prices, sorts):
+            properties = filter_properties(
+                status=status,
+                property_type=property_type,
+                bedrooms=beds,
+                price_range=price,
+                sort_by=sort_by,
+            )
+            label = f"status={status} type={property_type} bedrooms={beds} price={price} sort={sort_by}"
+            # The page query and the paginator's COUNT query
+            for kind, queryset in (('page', properties[:9]), ('count', properties.order_by().values('pk'))):
+                plan = queryset.explain()
+                checked += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{label} [{kind}]\n{plan}\n")
+                if is_full_scan(plan):
+                    failures.append(f"{label} [{kind}]\n{plan}")
+
+        if failures:
+            raise CommandError(
+                f"{len(failures)} of {checked} listing queries use a full table scan:\n\n" + "\n\n".join(failures)
+            )
+        self.stdout.write(self.style.SUCCESS(f"✅ All {checked} listing queries use an index"))
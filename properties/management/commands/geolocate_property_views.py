@@ -0,0 +1,33 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from properties.geolocation import geolocate_views, get_resolver
+from properties.models import PropertyView
+
+
+class Command(BaseCommand):
+    help = "Geolocate PropertyView rows the view buffer has not resolved yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            get_resolver()
+        except ImproperlyConfigured as exc:
+            raise CommandError(str(exc))
+
+        batch_size = options['batch_size']
+        resolved = failed = 0
+        last_id = 0
+        while True:
+            # Walk by id so views whose lookup fails are skipped rather than retried in a loop
+            batch = list(PropertyView.objects.filter(geo_resolved=False, id__gt=last_id).order_by('id')[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            count = geolocate_views(batch)
+            resolved += count
+            failed += len(batch) - count
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Geolocated {resolved} property views ({failed} lookups failed, left for the next run)"))
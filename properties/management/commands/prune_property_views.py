@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from properties.retention import PRUNE_BATCH_SIZE, prune_views
+
+
+class Command(BaseCommand):
+    help = "Archive and delete PropertyView rows older than the retention period"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help="Override PROPERTY_VIEW_RETENTION_DAYS")
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE)
+        parser.add_argument('--archive-dir', help="Override PROPERTY_VIEW_ARCHIVE_DIR")
+        parser.add_argument('--no-archive', action='store_true', help="Delete without writing archive files")
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        # Expired rows are only deleted once rolled up, so resolve stragglers first
+        call_command('geolocate_property_views', stdout=self.stdout)
+        deleted = prune_views(
+            days=options['days'],
+            batch_size=options['batch_size'],
+            archive_dir=options['archive_dir'],
+            archive=not options['no_archive'],
+            pause=options['pause'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Pruned {deleted} property views"))
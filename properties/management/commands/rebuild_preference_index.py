@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from properties.matching import rebuild_preference_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the saved-preference index used for new-listing alerts"
+
+    def handle(self, *args, **options):
+        count = rebuild_preference_index()
+        self.stdout.write(self.style.SUCCESS(f"✅ Indexed preferences of {count} users"))
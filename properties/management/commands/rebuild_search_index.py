@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from properties.search import ensure_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index for properties"
+
+    def handle(self, *args, **options):
+        ensure_search_index()
+        indexed = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"✅ Indexed {indexed} properties"))
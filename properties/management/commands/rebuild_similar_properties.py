@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from properties.recommendations import rebuild_similar
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed similar properties of every active listing"
+
+    def handle(self, *args, **options):
+        count = rebuild_similar()
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt similar properties for {count} listings"))
@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from properties.rollups import ROLLUP_BATCH_SIZE, ROLLUP_LAG, rollup_views
+
+
+class Command(BaseCommand):
+    help = "Fold new PropertyView rows into the PropertyViewDaily rollup"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE)
+        parser.add_argument(
+            '--lag', type=int, default=int(ROLLUP_LAG.total_seconds()),
+            help="Leave views younger than this many seconds for the next run",
+        )
+
+    def handle(self, *args, **options):
+        # The rollup waits for unresolved views, so resolve any stragglers first
+        call_command('geolocate_property_views', stdout=self.stdout)
+        folded = rollup_views(batch_size=options['batch_size'], lag=timedelta(seconds=options['lag']))
+        self.stdout.write(self.style.SUCCESS(f"✅ Rolled up {folded} property views"))
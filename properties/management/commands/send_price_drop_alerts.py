@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from properties.price_alerts import ALERT_BATCH_SIZE, ALERT_LAG, send_price_drop_alerts
+
+
+class Command(BaseCommand):
+    help = "Notify users who saved a listing whose price dropped since the last run"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=ALERT_BATCH_SIZE)
+        parser.add_argument(
+            '--lag', type=int, default=int(ALERT_LAG.total_seconds()),
+            help="Leave price changes younger than this many seconds for the next run",
+        )
+
+    def handle(self, *args, **options):
+        count = send_price_drop_alerts(
+            batch_size=options['batch_size'], lag=timedelta(seconds=options['lag']),
+        )
+        self.stdout.write(self.style.SUCCESS(f"✅ Sent {count} price drop alerts"))
@@ -0,0 +1,253 @@
+"""
+New-listing alerts from saved UserPreferences.
+
+Each user's preferences are expanded into PreferenceKey rows, one per
+(property type, locality, budget band) they would accept, with a blank
+type or locality and band ``ANY_BAND`` standing for "no preference".
+When a listing is created or its type, location, price or status
+changes, ``match_property`` looks up the at most eight keys that can
+match it in one indexed query, checks the exact budget and interest
+flags of just those candidates, and for each new match records a
+PropertyMatch, bulk-creates a ``property_match`` Notification and
+queues an email for users with ``email_new_listings`` enabled. The cost
+follows the number of candidates, not the number of users.
+
+The signals don't call ``match_property`` in the saving request: they
+hand the listing id to ``property_matcher``, a background thread that
+collects ids for a moment and matches each listing once per burst of
+writes, so a save never waits on (or fails because of) the matching
+pass. Ids still pending when the process exits are not matched.
+
+``rebuild_preference_index`` re-expands every user's preferences, e.g.
+after changing the band layout.
+"""
+import logging
+import math
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.urls import reverse
+
+from accounts.models import Notification, NotificationSettings, UserPreferences
+from accounts.outbox import queue_mass_email
+
+from .models import PreferenceKey, Property, PropertyMatch
+
+logger = logging.getLogger(__name__)
+
+# Budget bands double in width from BAND_BASE rupees upward
+BAND_BASE = 100_000
+MAX_BAND = 16
+ANY_BAND = -1
+MATCH_BATCH_SIZE = 500
+# Seconds the matcher waits for more writes before matching
+MATCH_DELAY = 1.0
+# Labels used on the account settings form that differ from Property.TYPE_CHOICES
+TYPE_ALIASES = {
+    'independent house': 'house',
+    'plot': 'land',
+    'commercial space': 'commercial',
+    'office space': 'office',
+    'warehouse': 'commercial',
+}
+# Which UserPreferences interest a listing's status needs
+STATUS_INTEREST = {
+    'for_sale': 'interest_buying',
+    'for_rent': 'interest_renting',
+}
+
+
+def normalize_type(value):
+    value = str(value).strip().lower()
+    return TYPE_ALIASES.get(value, value)
+
+
+def normalize_location(value):
+    """Locality part of a location, e.g. ``"Civil Lines, Nagpur"`` -> ``"civil lines"``."""
+    return str(value).split(',')[0].strip().lower()[:200]
+
+
+def budget_band(amount):
+    amount = float(amount)
+    if amount < 2 * BAND_BASE:
+        return 0
+    return min(MAX_BAND, int(math.log2(amount / BAND_BASE)))
+
+
+def preference_bands(min_budget, max_budget):
+    if min_budget is None and max_budget is None:
+        return [ANY_BAND]
+    low = budget_band(min_budget or 0)
+    high = budget_band(max_budget) if max_budget is not None else MAX_BAND
+    return list(range(low, high + 1))
+
+
+def preference_keys(preferences):
+    types = {normalize_type(value) for value in preferences.property_types or [] if str(value).strip()} or {''}
+    locations = {normalize_location(value) for value in preferences.preferred_locations or [] if str(value).strip()} or {''}
+    bands = preference_bands(preferences.min_budget, preferences.max_budget)
+    return [
+        PreferenceKey(user_id=preferences.user_id, type=type_, location=location, band=band)
+        for type_ in types for location in locations for band in bands
+    ]
+
+
+def index_preferences(preferences):
+    """Replace one user's index entries with those for ``preferences``."""
+    with transaction.atomic():
+        PreferenceKey.objects.filter(user_id=preferences.user_id).delete()
+        PreferenceKey.objects.bulk_create(preference_keys(preferences), batch_size=500)
+
+
+def unindex_user(user_id):
+    PreferenceKey.objects.filter(user_id=user_id).delete()
+
+
+def rebuild_preference_index():
+    """Rebuild the whole index; returns the number of users indexed."""
+    count = 0
+    with transaction.atomic():
+        PreferenceKey.objects.all().delete()
+        batch = []
+        for preferences in UserPreferences.objects.iterator(chunk_size=MATCH_BATCH_SIZE):
+            batch.extend(preference_keys(preferences))
+            count += 1
+            if len(batch) >= 5000:
+                PreferenceKey.objects.bulk_create(batch, batch_size=500)
+                batch = []
+        PreferenceKey.objects.bulk_create(batch, batch_size=500)
+    return count
+
+
+def candidate_users(property_obj):
+    """Ids of users whose index entries cover the listing's type, locality and price band."""
+    return set(
+        PreferenceKey.objects.filter(
+            type__in=[property_obj.type, ''],
+            location__in=[normalize_location(property_obj.location), ''],
+            band__in=[budget_band(property_obj.price), ANY_BAND],
+        ).values_list('user_id', flat=True).distinct()
+    )
+
+
+def _accepts(preferences, property_obj):
+    price = Decimal(property_obj.price)
+    if preferences.min_budget is not None and price < preferences.min_budget:
+        return False
+    if preferences.max_budget is not None and price > preferences.max_budget:
+        return False
+    return getattr(preferences, STATUS_INTEREST[property_obj.status])
+
+
+def _announce(property_obj, user_ids):
+    """Record and announce the matches not already recorded; returns how many users were notified."""
+    title = f"New match: {property_obj.title}"
+    message = (
+        f"{property_obj.title} in {property_obj.location} is listed at ₹{property_obj.price:,.0f} "
+        f"and matches your saved preferences."
+    )
+    url = getattr(settings, 'SITE_URL', '').rstrip('/') + reverse('properties:property_detail', args=[property_obj.pk])
+    with transaction.atomic():
+        # Locking the listing serializes concurrent runs for it, so each match is announced by one of them
+        list(Property.objects.select_for_update().filter(pk=property_obj.pk).values_list('pk', flat=True))
+        user_ids = set(user_ids) - set(
+            PropertyMatch.objects.filter(property=property_obj, user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        if not user_ids:
+            return 0
+        opted_out = set(
+            NotificationSettings.objects.filter(user_id__in=user_ids, email_new_listings=False).values_list('user_id', flat=True)
+        )
+        recipients = (
+            UserPreferences.objects.filter(user_id__in=user_ids - opted_out)
+            .exclude(user__email='').values_list('user__email', 'user__first_name')
+        )
+        PropertyMatch.objects.bulk_create([PropertyMatch(user_id=user_id, property=property_obj) for user_id in user_ids])
+        Notification.objects.bulk_create(
+            [Notification(user_id=user_id, title=title, message=message, type='property_match') for user_id in user_ids]
+        )
+        queue_mass_email(
+            (title, f"Hi {name or 'there'},\n\n{message}\n\nView it here: {url}\n\n— DreamHomes Realty", None, [email])
+            for email, name in recipients
+        )
+    return len(user_ids)
+
+
+def match_property(property_obj):
+    """Notify every user whose preferences newly match the listing; returns how many were notified."""
+    if not property_obj.is_active or property_obj.status not in STATUS_INTEREST:
+        return 0
+    candidates = candidate_users(property_obj)
+    if not candidates:
+        return 0
+    candidates -= set(PropertyMatch.objects.filter(property=property_obj).values_list('user_id', flat=True))
+    candidates = sorted(candidates)
+    notified = 0
+    for start in range(0, len(candidates), MATCH_BATCH_SIZE):
+        batch = (
+            UserPreferences.objects.filter(user_id__in=candidates[start:start + MATCH_BATCH_SIZE], user__is_active=True)
+            .only('user_id', 'min_budget', 'max_budget', 'interest_buying', 'interest_renting')
+        )
+        matched = [preferences.user_id for preferences in batch if _accepts(preferences, property_obj)]
+        if matched:
+            notified += _announce(property_obj, matched)
+    return notified
+
+
+class PropertyMatcher:
+    """Collects saved listing ids and matches each one once per burst of writes."""
+
+    def __init__(self, delay=MATCH_DELAY, background=True):
+        self.delay = delay
+        self.background = background
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, *property_ids):
+        with self._lock:
+            self._pending.update(property_id for property_id in property_ids if property_id is not None)
+            if self.background and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='property-matching', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return set(self._pending)
+
+    def run_pending(self):
+        """Match everything collected so far; returns the number of users notified."""
+        with self._lock:
+            property_ids, self._pending = self._pending, set()
+        notified = 0
+        for property_obj in Property.objects.filter(pk__in=property_ids).order_by('pk'):
+            try:
+                notified += match_property(property_obj)
+            except Exception:
+                logger.exception("Matching property %s failed", property_obj.pk)
+        return notified
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Matching saved properties failed")
+            finally:
+                close_old_connections()
+
+
+property_matcher = PropertyMatcher()
+
+
+def queue_match(property_id):
+    """Match the listing against saved preferences in the background once the transaction commits."""
+    transaction.on_commit(lambda: property_matcher.add(property_id))
@@ -5,6 +5,7 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from agents.models import Agent
+from .renditions import rendition_url, srcset
 
 from django.db import models
 from django.utils import timezone
@@ -41,9 +42,8 @@ class Property(models.Model):
     @property
     def image_url(self):
         """Return the URL of the primary image or a default image if none exists."""
-        primary = self.images.filter(is_primary=True).first()
-        if primary and primary.image:
-            return primary.image.url
+        if self.primary_image:
+            return self.primary_image.url
         return 'https://via.placeholder.com/300x200?text=No+Image'
     # 🔹 Define all choices first
     STATUS_CHOICES = [
@@ -97,6 +97,8 @@ class Property(models.Model):
     pincode = models.CharField(max_length=10)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    # Derived from latitude/longitude on save; see properties.geo
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
     location_description = models.TextField(blank=True)
     
     # Property Details
@@ -118,6 +120,10 @@ class Property(models.Model):
     
     # Relationships
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='properties')
+
+    # Denormalized copy of the primary PropertyImage, kept in sync by signals
+    primary_image = models.ImageField(upload_to='property_images/', blank=True, editable=False)
+    primary_renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -126,20 +132,53 @@ class Property(models.Model):
     class Meta:
         verbose_name_plural = "Properties"
         ordering = ['-featured', '-created_at']
+        # Partial indexes over active listings, shaped after the get_properties
+        # filter/sort matrix (see the explain_property_queries command)
+        indexes = [
+            models.Index(fields=['is_active'], name='prop_active_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['created_at'], name='prop_active_created_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['price'], name='prop_active_price_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['title'], name='prop_active_title_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['status', 'type', 'bedrooms', 'price'], name='prop_active_stb_price_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['type', 'bedrooms', 'price'], name='prop_active_tb_price_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['bedrooms', 'price'], name='prop_active_beds_price_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['status', 'created_at'], name='prop_active_status_crt_idx', condition=models.Q(is_active=True)),
+            # Not partial: SQLite only combines OR-ed geohash ranges (MULTI-INDEX OR) on a plain index
+            models.Index(fields=['geohash'], name='prop_geohash_idx'),
+        ]
     
     def __str__(self):
         return f"{self.property_id} - {self.title}"
     
     @property
     def primary_image_url(self):
-        primary = self.images.filter(is_primary=True).first()
-        if primary and primary.image:
-            return primary.image.url
+        if self.primary_image:
+            return self.primary_image.url
         return 'https://via.placeholder.com/600x400?text=No+Image'
 
+    def refresh_primary_image(self):
+        """Re-read the primary PropertyImage into the cached `primary_image` columns."""
+        primary = self.images.filter(is_primary=True).first()
+        self.primary_image = primary.image.name if primary and primary.image else ''
+        self.primary_renditions = primary.renditions if primary and primary.image else {}
+        Property.objects.filter(pk=self.pk).update(
+            primary_image=self.primary_image, primary_renditions=self.primary_renditions
+        )
+
+    @property
+    def primary_avif_srcset(self):
+        return srcset(self.primary_renditions, 'avif')
+
+    @property
+    def primary_webp_srcset(self):
+        return srcset(self.primary_renditions, 'webp')
+
     @property
     def gallery_images(self):
         """Return all images ordered by `order` field or any logic."""
+        gallery = getattr(self, 'prefetched_gallery', None)
+        if gallery is not None:
+            return gallery
         return self.images.all().order_by('order')
     
     
@@ -158,14 +197,23 @@ class Property(models.Model):
             date_part = datetime.now().strftime('%y%m')
             random_part = get_random_string(4, '0123456789')
             self.property_id = f"PROP-{date_part}-{random_part}"
+        self.geohash = self.compute_geohash()
         super().save(*args, **kwargs)
 
+    def compute_geohash(self):
+        from .geo import encode
+        if self.latitude is None or self.longitude is None:
+            return ''
+        return encode(self.latitude, self.longitude)
+
 class PropertyImage(models.Model):
     property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='property_images/')
     alt_text = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveIntegerField(default=0)
+    # Generated WebP/AVIF files by width; see properties.renditions
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         ordering = ['is_primary', 'order']
@@ -173,6 +221,16 @@ class PropertyImage(models.Model):
     def __str__(self):
         return f"Image for {self.property.title}"
 
+    # Plain methods: `property` is a field here; templates call them all the same
+    def avif_srcset(self):
+        return srcset(self.renditions, 'avif')
+
+    def webp_srcset(self):
+        return srcset(self.renditions, 'webp')
+
+    def thumb_url(self):
+        return rendition_url(self.renditions, 'thumb') or self.image.url
+
 class Amenity(models.Model):
     name = models.CharField(max_length=100)
     icon_class = models.CharField(max_length=50, default='fas fa-check')
@@ -202,14 +260,78 @@ class NearbyPlace(models.Model):
     def __str__(self):
         return f"{self.name} near {self.property.title}"
 
+
+class SimilarProperty(models.Model):
+    """Precomputed nearest neighbours of a listing; see properties.recommendations."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ['property', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'similar'], name='similar_property_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.similar.title} similar to {self.property.title}"
+
+
+class PreferenceKey(models.Model):
+    """Inverted index of UserPreferences; see properties.matching. Blank type/location and band -1 match anything."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='preference_keys')
+    type = models.CharField(max_length=20, blank=True)
+    location = models.CharField(max_length=200, blank=True)
+    band = models.SmallIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['type', 'location', 'band'], name='preference_key_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.type or '*'}/{self.location or '*'}/{self.band} -> {self.user_id}"
+
+
+class PropertyMatch(models.Model):
+    """A listing already announced to a user, so edits never notify twice."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='property_matches')
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='matches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'user'], name='property_match_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.property.title} matched for {self.user}"
+
+
+class PropertyPriceHistory(models.Model):
+    """One row per price a listing has had; ``old_price`` is empty for the first."""
+    property = models.ForeignKey(Property, on_delete=models.CASCADE, related_name='price_history')
+    old_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    new_price = models.DecimalField(max_digits=12, decimal_places=2)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-changed_at']
+        verbose_name_plural = "Property price history"
+
+    def __str__(self):
+        return f"{self.property.title}: {self.old_price} -> {self.new_price}"
+
 # models.py
 from django.db import models
 
 class PropertyView(models.Model):
     property = models.ForeignKey('Property', on_delete=models.CASCADE, related_name='views')
     ip_address = models.GenericIPAddressField()
-    user_agent = models.TextField(blank=True)
-    viewed_at = models.DateTimeField(auto_now_add=True)
+    user_agent = models.ForeignKey('accounts.UserAgent', on_delete=models.PROTECT, null=True, blank=True, related_name='property_views')
+    # Set when the view happens; rows are written later in batches
+    viewed_at = models.DateTimeField(default=timezone.now)
 
     # New fields for IP geolocation
     country = models.CharField(max_length=100, blank=True, null=True)
@@ -218,14 +340,51 @@ class PropertyView(models.Model):
     latitude = models.FloatField(blank=True, null=True)
     longitude = models.FloatField(blank=True, null=True)
     isp = models.CharField(max_length=150, blank=True, null=True)
+    # Set once the buffered flush (or the backfill command) has filled the fields above
+    geo_resolved = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-viewed_at']
+        indexes = [
+            models.Index(fields=['viewed_at'], name='propview_viewed_idx'),
+            models.Index(fields=['viewed_at'], name='propview_unresolved_idx', condition=models.Q(geo_resolved=False)),
+        ]
 
     def __str__(self):
         return f"{self.property.title} viewed from {self.ip_address}"
 
 
+class PropertyViewDaily(models.Model):
+    """Views per property per day and visitor location, rolled up from PropertyView."""
+    property = models.ForeignKey('Property', on_delete=models.CASCADE, related_name='daily_views')
+    day = models.DateField()
+    country = models.CharField(max_length=100, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    views = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['property', 'day', 'country', 'city'], name='propview_daily_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='propview_daily_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.property.title} on {self.day}: {self.views} views"
+
+
+class RollupWatermark(models.Model):
+    """Highest source row id already folded into a rollup."""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
 from django.db import models
 
 class ContactMessage(models.Model):
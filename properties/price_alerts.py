@@ -0,0 +1,103 @@
+"""
+Price-drop alerts for saved listings.
+
+Every price a listing takes is recorded in PropertyPriceHistory by the
+Property signals. ``send_price_drop_alerts`` (the
+``send_price_drop_alerts`` command) reads history rows past its
+watermark in batches, nets each listing's changes within the batch, and
+fetches everyone who saved a listing that got cheaper with one joined
+query. Users who turned off ``email_price_drop_alerts`` are left out.
+The holders then get a ``price_drop`` Notification and an email, both
+bulk-inserted in the same transaction that advances the watermark. The
+watermark row is locked for that transaction, so overlapping runs take
+turns instead of alerting the same batch twice.
+
+The watermark is a row id, and ids are handed out when a row is
+inserted but become visible when its transaction commits. On databases
+with concurrent writers (PostgreSQL) a row with a lower id can therefore
+appear after a higher one was already processed, and it would be
+skipped. Rows changed within the last ``ALERT_LAG`` are left for the
+next run to give such transactions time to commit; a transaction that
+stays open longer than that can still be missed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Notification, NotificationSettings
+from accounts.outbox import queue_mass_email
+
+from .models import PropertyPriceHistory, RollupWatermark, SavedProperty
+
+PRICE_ALERTS = 'price_drop_alerts'
+ALERT_BATCH_SIZE = 1000
+ALERT_LAG = timedelta(minutes=1)
+
+
+def net_drops(history):
+    """``{property id: (first old price, last new price)}`` for listings that ended the batch cheaper."""
+    changes = {}
+    for row in history:
+        first_old = changes.get(row.property_id, (None,))[0]
+        if first_old is None:
+            first_old = row.old_price
+        changes[row.property_id] = (first_old, row.new_price)
+    return {
+        property_id: (old, new)
+        for property_id, (old, new) in changes.items()
+        if old is not None and new < old
+    }
+
+
+def price_drop_holders(property_ids):
+    """``(user id, email, first name, property id, title)`` for opted-in holders of the listings."""
+    opted_out = NotificationSettings.objects.filter(user=OuterRef('user'), email_price_drop_alerts=False)
+    return (
+        SavedProperty.objects.filter(property_id__in=property_ids, property__is_active=True, user__is_active=True)
+        .exclude(Exists(opted_out))
+        .values_list('user_id', 'user__email', 'user__first_name', 'property_id', 'property__title')
+    )
+
+
+def _alert(drops):
+    site_url = getattr(settings, 'SITE_URL', '').rstrip('/')
+    notifications = []
+    emails = []
+    for user_id, email, name, property_id, title in price_drop_holders(list(drops)):
+        old, new = drops[property_id]
+        subject = f"Price drop: {title}"
+        message = f"{title}, which you saved, is now ₹{new:,.0f} (was ₹{old:,.0f})."
+        notifications.append(Notification(user_id=user_id, title=subject, message=message, type='price_drop'))
+        if email:
+            url = site_url + reverse('properties:property_detail', args=[property_id])
+            body = f"Hi {name or 'there'},\n\n{message}\n\nView it here: {url}\n\n— DreamHomes Realty"
+            emails.append((subject, body, None, [email]))
+    Notification.objects.bulk_create(notifications, batch_size=500)
+    queue_mass_email(emails)
+    return len(notifications)
+
+
+def send_price_drop_alerts(batch_size=ALERT_BATCH_SIZE, lag=ALERT_LAG):
+    """Alert holders about price drops recorded since the last run; returns the number of alerts."""
+    RollupWatermark.objects.get_or_create(name=PRICE_ALERTS)
+    cutoff = timezone.now() - lag
+    alerted = 0
+    while True:
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=PRICE_ALERTS)
+            history = list(
+                PropertyPriceHistory.objects.filter(id__gt=watermark.last_id, changed_at__lte=cutoff)
+                .order_by('id').only('id', 'property_id', 'old_price', 'new_price')[:batch_size]
+            )
+            if not history:
+                break
+            drops = net_drops(history)
+            if drops:
+                alerted += _alert(drops)
+            watermark.last_id = history[-1].id
+            watermark.save(update_fields=['last_id', 'updated_at'])
+    return alerted
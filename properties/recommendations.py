@@ -0,0 +1,233 @@
+"""
+Precomputed "similar properties" for the detail page.
+
+Every active listing becomes a row of a compact NumPy feature matrix
+(type, status, log price, bedrooms, log area, coordinates and an
+amenity bitmap). Similarity to all other listings is computed for a
+block of rows at a time with vectorized arithmetic, and the best
+``SIMILAR_COUNT`` neighbours of each listing are stored in
+SimilarProperty, so rendering a detail page is a single indexed read.
+
+``refresh_similar`` keeps the table current after a write: it recomputes
+the changed listings, plus every listing whose stored neighbours
+include a changed one or would now rank it above their weakest entry.
+Writes don't call it directly: the signals hand the changed ids to
+``similar_refresher``, a background thread that collects ids for a
+moment and refreshes each burst once, so a request never loads the
+matrix and a bulk import is not quadratic. Ids still pending at exit are
+picked up by the periodic ``rebuild_similar_properties`` command.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Min
+
+from .geo import KM_PER_DEGREE
+from .models import Property, PropertyAmenity, SimilarProperty
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_COUNT = 6
+BLOCK_SIZE = 512
+# Seconds the refresher waits for more writes before recomputing
+REFRESH_DELAY = 2.0
+
+WEIGHTS = {
+    'status': 3.0,
+    'type': 2.0,
+    'price': 2.0,
+    'bedrooms': 1.0,
+    'area': 1.0,
+    'distance': 1.5,
+    'amenities': 1.0,
+}
+# Log-ratio of price or area at which that score has dropped to 1/e
+PRICE_SCALE = 0.35
+AREA_SCALE = 0.35
+DISTANCE_SCALE_KM = 10.0
+
+
+class FeatureMatrix:
+    """Features of all active listings, one row per listing in id order."""
+
+    def __init__(self, rows, amenity_pairs):
+        self.ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self.position = {property_id: index for index, property_id in enumerate(self.ids.tolist())}
+        _, self.type = np.unique([row[1] for row in rows], return_inverse=True)
+        _, self.status = np.unique([row[2] for row in rows], return_inverse=True)
+        self.log_price = np.log1p(np.array([float(row[3]) for row in rows]))
+        self.bedrooms = np.array([row[4] for row in rows], dtype=np.float64)
+        self.log_area = np.log1p(np.array([float(row[5]) for row in rows]))
+        self.has_coords = np.array([row[6] is not None and row[7] is not None for row in rows])
+        self.lat = np.array([float(row[6]) if row[6] is not None else 0.0 for row in rows])
+        self.lng = np.array([float(row[7]) if row[7] is not None else 0.0 for row in rows])
+
+        amenity_ids = sorted({amenity_id for _, amenity_id in amenity_pairs})
+        columns = {amenity_id: index for index, amenity_id in enumerate(amenity_ids)}
+        self.amenities = np.zeros((len(rows), len(amenity_ids)), dtype=np.float32)
+        for property_id, amenity_id in amenity_pairs:
+            if property_id in self.position:
+                self.amenities[self.position[property_id], columns[amenity_id]] = 1.0
+        self.amenity_counts = self.amenities.sum(axis=1)
+
+    @classmethod
+    def load(cls):
+        rows = list(
+            Property.objects.filter(is_active=True).order_by('id')
+            .values_list('id', 'type', 'status', 'price', 'bedrooms', 'total_area', 'latitude', 'longitude')
+        )
+        pairs = list(
+            PropertyAmenity.objects.filter(property__is_active=True).values_list('property_id', 'amenity_id')
+        )
+        return cls(rows, pairs)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, rows):
+        """Similarity of the listings at ``rows`` to every listing, in [0, 1]; self-matches are -inf."""
+        rows = np.asarray(rows)
+        score = WEIGHTS['status'] * (self.status[rows, None] == self.status[None, :])
+        score = score + WEIGHTS['type'] * (self.type[rows, None] == self.type[None, :])
+        score += WEIGHTS['price'] * np.exp(-np.abs(self.log_price[rows, None] - self.log_price[None, :]) / PRICE_SCALE)
+        score += WEIGHTS['bedrooms'] / (1.0 + np.abs(self.bedrooms[rows, None] - self.bedrooms[None, :]))
+        score += WEIGHTS['area'] * np.exp(-np.abs(self.log_area[rows, None] - self.log_area[None, :]) / AREA_SCALE)
+
+        # Equirectangular distance, good enough to tell "same area" from "across town"
+        scale = np.cos(np.radians(self.lat[rows, None]))
+        dy = self.lat[rows, None] - self.lat[None, :]
+        dx = (self.lng[rows, None] - self.lng[None, :]) * scale
+        distance = np.hypot(dx, dy) * KM_PER_DEGREE
+        located = self.has_coords[rows, None] & self.has_coords[None, :]
+        score += WEIGHTS['distance'] * np.where(located, np.exp(-distance / DISTANCE_SCALE_KM), 0.0)
+
+        if self.amenities.shape[1]:
+            shared = self.amenities[rows] @ self.amenities.T
+            union = self.amenity_counts[rows, None] + self.amenity_counts[None, :] - shared
+            score += WEIGHTS['amenities'] * np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+
+        score /= sum(WEIGHTS.values())
+        score[np.arange(len(rows)), rows] = -np.inf
+        return score
+
+    def neighbours(self, rows, count=SIMILAR_COUNT):
+        """``{property id: [(similar id, score), ...]}`` best first for the listings at ``rows``."""
+        result = {}
+        count = min(count, len(self) - 1)
+        for start in range(0, len(rows), BLOCK_SIZE):
+            block = np.asarray(rows[start:start + BLOCK_SIZE])
+            scores = self.scores(block)
+            if count <= 0:
+                best = np.empty((len(block), 0), dtype=np.int64)
+            else:
+                best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+            for offset, row in enumerate(block.tolist()):
+                candidates = sorted(best[offset].tolist(), key=lambda column: (-scores[offset, column], column))
+                result[int(self.ids[row])] = [(int(self.ids[column]), float(scores[offset, column])) for column in candidates]
+        return result
+
+
+def _store(neighbours):
+    with transaction.atomic():
+        SimilarProperty.objects.filter(property_id__in=list(neighbours)).delete()
+        SimilarProperty.objects.bulk_create([
+            SimilarProperty(property_id=property_id, similar_id=similar_id, score=score, rank=rank)
+            for property_id, similar in neighbours.items()
+            for rank, (similar_id, score) in enumerate(similar, start=1)
+        ], batch_size=500)
+
+
+def rebuild_similar():
+    """Recompute neighbours for every active listing; returns the number of listings."""
+    matrix = FeatureMatrix.load()
+    for start in range(0, len(matrix), BLOCK_SIZE):
+        _store(matrix.neighbours(list(range(start, min(start + BLOCK_SIZE, len(matrix))))))
+    SimilarProperty.objects.exclude(property__is_active=True).delete()
+    return len(matrix)
+
+
+def refresh_similar(*property_ids):
+    """Bring stored neighbours up to date after the given listings changed or were removed."""
+    matrix = FeatureMatrix.load()
+    changed = {property_id for property_id in property_ids if property_id is not None}
+    active = [matrix.position[property_id] for property_id in changed if property_id in matrix.position]
+
+    SimilarProperty.objects.filter(property_id__in=changed - set(matrix.position)).delete()
+    # Lists that contain a changed listing may need to drop or reorder it
+    affected = set(SimilarProperty.objects.filter(similar_id__in=changed).values_list('property_id', flat=True))
+
+    if active:
+        full = min(SIMILAR_COUNT, len(matrix) - 1)
+        thresholds = {
+            row['property_id']: row['weakest'] if row['stored'] >= full else -np.inf
+            for row in SimilarProperty.objects.values('property_id').annotate(weakest=Min('score'), stored=Count('id')).order_by()
+        }
+        # Listings with nothing stored yet are left to rebuild_similar_properties
+        weakest = np.array([thresholds.get(property_id, np.inf) for property_id in matrix.ids.tolist()])
+        scores = matrix.scores(active)
+        # Lists the changed listings would now enter
+        entering = np.nonzero((scores > weakest[None, :]).any(axis=0))[0]
+        affected.update(int(matrix.ids[column]) for column in entering.tolist())
+
+    rows = sorted(set(active) | {matrix.position[property_id] for property_id in affected if property_id in matrix.position})
+    if rows:
+        _store(matrix.neighbours(rows))
+    return len(rows)
+
+
+class SimilarRefresher:
+    """Collects changed listing ids and refreshes them in one pass per burst of writes."""
+
+    def __init__(self, delay=REFRESH_DELAY, background=True):
+        self.delay = delay
+        self.background = background
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, *property_ids):
+        with self._lock:
+            self._pending.update(property_id for property_id in property_ids if property_id is not None)
+            if self.background and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='similar-properties', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return set(self._pending)
+
+    def run_pending(self):
+        """Refresh everything collected so far; returns the number of listings recomputed."""
+        with self._lock:
+            property_ids, self._pending = self._pending, set()
+        if not property_ids:
+            return 0
+        if len(property_ids) > BLOCK_SIZE:
+            # Cheaper to recompute everything than to score this many changes against all lists
+            return rebuild_similar()
+        return refresh_similar(*property_ids)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            self._wakeup.clear()
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Refreshing similar properties failed")
+            finally:
+                close_old_connections()
+
+
+similar_refresher = SimilarRefresher()
+
+
+def queue_similar_refresh(*property_ids):
+    """Refresh the neighbours of these listings in the background once the transaction commits."""
+    transaction.on_commit(lambda: similar_refresher.add(*property_ids))
@@ -0,0 +1,154 @@
+"""
+Responsive renditions of uploaded property images.
+
+After a PropertyImage is saved a background worker re-encodes it with
+Pillow as WebP (and AVIF where Pillow has an encoder for it) at the
+widths in ``RENDITION_WIDTHS``, never upscaling. Files are named after a
+hash of their content, so they can be served with far-future cache
+headers and an unchanged image is never stored twice. The generated
+names are recorded on ``PropertyImage.renditions`` and, for the primary
+image, copied to ``Property.primary_renditions`` so listing cards get
+``srcset`` values without extra queries.
+
+Images that were saved while no worker was running can be processed
+with the ``build_image_renditions`` management command.
+"""
+import hashlib
+import io
+import logging
+import queue
+import threading
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = {
+    'thumb': 160,
+    'card': 480,
+    'gallery': 960,
+    'full': 1920,
+}
+# Best compression first; browsers take the first <source> they support
+RENDITION_FORMATS = ('avif', 'webp')
+RENDITION_QUALITY = {'avif': 60, 'webp': 80}
+RENDITION_DIR = 'property_images/renditions'
+
+
+def available_formats():
+    Image.init()
+    return [fmt for fmt in RENDITION_FORMATS if fmt.upper() in Image.SAVE]
+
+
+def target_widths(width):
+    """Widths to render for a source ``width`` pixels wide, without upscaling."""
+    widths = {w for w in RENDITION_WIDTHS.values() if w < width}
+    widths.add(min(width, RENDITION_WIDTHS['full']))
+    return sorted(widths)
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt.upper(), quality=RENDITION_QUALITY[fmt])
+    return buffer.getvalue()
+
+
+def _store(content, width, fmt):
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    name = f'{RENDITION_DIR}/{digest}-{width}.{fmt}'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def render(source):
+    """Encode an image file as every rendition; returns the ``renditions`` dict without ``source``."""
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original)
+        original = original.convert('RGBA' if original.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        formats = available_formats()
+        renditions = {fmt: [] for fmt in formats}
+        for width in target_widths(original.width):
+            height = max(1, round(original.height * width / original.width))
+            resized = original if width == original.width else original.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                renditions[fmt].append([width, _store(_encode(resized, fmt), width, fmt)])
+    return renditions
+
+
+def build_renditions(image_id):
+    """Render one PropertyImage and record the result; returns False if it has nothing to render."""
+    from .models import Property, PropertyImage
+
+    property_image = PropertyImage.objects.filter(pk=image_id).first()
+    if property_image is None or not property_image.image:
+        return False
+    name = property_image.image.name
+    with property_image.image.open('rb') as source:
+        renditions = {'source': name, **render(source)}
+
+    # The image may have been replaced while rendering; that save queued its own job
+    updated = PropertyImage.objects.filter(pk=image_id, image=name).update(renditions=renditions)
+    if updated and property_image.is_primary:
+        Property.objects.get(pk=property_image.property_id).refresh_primary_image()
+        from .signals import invalidate_listings, touch_properties
+        touch_properties(pk=property_image.property_id)
+        invalidate_listings()
+    return bool(updated)
+
+
+def srcset(renditions, fmt):
+    """``srcset`` attribute value for one format of a ``renditions`` dict."""
+    return ', '.join(f'{default_storage.url(name)} {width}w' for width, name in (renditions or {}).get(fmt, []))
+
+
+def rendition_url(renditions, size, fmt='webp'):
+    """URL of the smallest rendition at least as wide as ``size``, or None."""
+    entries = (renditions or {}).get(fmt)
+    if not entries:
+        return None
+    wanted = RENDITION_WIDTHS[size]
+    for width, name in entries:
+        if width >= wanted:
+            return default_storage.url(name)
+    return default_storage.url(entries[-1][1])
+
+
+class RenditionWorker:
+    """Daemon thread that renders queued PropertyImage ids one at a time."""
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, image_id):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='property-image-renditions', daemon=True)
+                self._thread.start()
+        try:
+            self.queue.put_nowait(image_id)
+        except queue.Full:
+            logger.warning("Rendition queue full, leaving image %s to build_image_renditions", image_id)
+
+    def _run(self):
+        while True:
+            image_id = self.queue.get()
+            try:
+                build_renditions(image_id)
+            except Exception:
+                logger.exception("Could not render image %s", image_id)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+rendition_worker = RenditionWorker()
+
+
+def enqueue_renditions(image_id):
+    rendition_worker.enqueue(image_id)
@@ -0,0 +1,84 @@
+"""
+Retention for the raw PropertyView log.
+
+Views older than ``PROPERTY_VIEW_RETENTION_DAYS`` are removed once they
+have been folded into PropertyViewDaily. Before deletion each batch is
+appended to gzip-compressed CSV files partitioned by the day of the view
+(``<archive dir>/YYYY/MM/property_views-YYYY-MM-DD.csv.gz``). Every
+batch is a short transaction of its own, so the log is never locked for
+the length of the whole purge.
+
+A run interrupted between archiving and deleting a batch archives those
+rows again on the next run; archive rows carry the view id for
+de-duplication.
+"""
+import csv
+import gzip
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PropertyView, RollupWatermark
+from .rollups import VIEW_ROLLUP, rollup_views
+
+ARCHIVE_FIELDS = (
+    'id', 'property_id', 'viewed_at', 'ip_address', 'user_agent__raw',
+    'country', 'region', 'city', 'latitude', 'longitude', 'isp',
+)
+ARCHIVE_COLUMNS = tuple(field.replace('__raw', '') for field in ARCHIVE_FIELDS)
+PRUNE_BATCH_SIZE = 1000
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'PROPERTY_VIEW_RETENTION_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_path(archive_dir, day):
+    return Path(archive_dir) / f'{day:%Y}' / f'{day:%m}' / f'property_views-{day:%Y-%m-%d}.csv.gz'
+
+
+def _archive(rows, archive_dir):
+    by_day = {}
+    viewed_at = ARCHIVE_FIELDS.index('viewed_at')
+    for row in rows:
+        by_day.setdefault(timezone.localtime(row[viewed_at]).date(), []).append(row)
+    for day, day_rows in by_day.items():
+        path = archive_path(archive_dir, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        new_file = not path.exists()
+        # Appending adds a gzip member; readers see one continuous stream
+        with gzip.open(path, 'at', newline='', encoding='utf-8') as handle:
+            writer = csv.writer(handle)
+            if new_file:
+                writer.writerow(ARCHIVE_COLUMNS)
+            writer.writerows(day_rows)
+
+
+def prune_views(days=None, batch_size=PRUNE_BATCH_SIZE, archive_dir=None, archive=True, pause=0):
+    """Archive and delete expired views; returns the number of rows deleted."""
+    if archive_dir is None:
+        archive_dir = getattr(settings, 'PROPERTY_VIEW_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive' / 'property_views')
+    cutoff = retention_cutoff(days)
+    rollup_views()
+    # Only rows the rollup has already counted may go
+    rolled_up = RollupWatermark.objects.filter(name=VIEW_ROLLUP).values_list('last_id', flat=True).first() or 0
+
+    expired = PropertyView.objects.filter(viewed_at__lt=cutoff, id__lte=rolled_up).order_by('id')
+    deleted = 0
+    while True:
+        rows = list(expired.values_list(*ARCHIVE_FIELDS)[:batch_size])
+        if not rows:
+            break
+        if archive:
+            _archive(rows, archive_dir)
+        with transaction.atomic():
+            deleted += PropertyView.objects.filter(id__in=[row[0] for row in rows]).delete()[0]
+        if pause:
+            time.sleep(pause)
+    return deleted
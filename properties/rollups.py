@@ -0,0 +1,127 @@
+"""
+Daily rollups of the PropertyView log.
+
+``rollup_views`` folds raw views into PropertyViewDaily (property, day,
+country, city) in id order, starting after the watermark left by the
+previous run, so each run only reads rows that arrived since. It stops
+before the first view that has not been geolocated yet so those rows are
+counted under their final location once resolved; views whose lookups
+keep failing are given up on by ``geolocate_views`` and counted under no
+location. Dashboards read the
+rollup instead of scanning the raw log.
+
+Each batch locks the watermark row for its transaction, so overlapping
+runs (the ``rollup_property_views`` command and the rollup that
+``prune_views`` does first) take turns instead of counting the same
+views twice. As with price alerts, an id watermark can skip a row whose
+transaction commits after a higher id was folded; views from the last
+``ROLLUP_LAG`` are left for the next run to give buffered inserts time
+to commit.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import PropertyView, PropertyViewDaily, RollupWatermark
+
+VIEW_ROLLUP = 'property_view_daily'
+ROLLUP_BATCH_SIZE = 10000
+ROLLUP_LAG = timedelta(minutes=1)
+
+
+def _fold(rows):
+    """Add aggregated view counts into the matching PropertyViewDaily rows; returns the views added."""
+    counts = {
+        (row['property_id'], row['day'], row['view_country'], row['view_city']): row['views']
+        for row in rows
+    }
+    if not counts:
+        return 0
+    total = sum(counts.values())
+    existing = PropertyViewDaily.objects.filter(
+        property_id__in={key[0] for key in counts},
+        day__in={key[1] for key in counts},
+    )
+    changed = []
+    for daily in existing:
+        key = (daily.property_id, daily.day, daily.country, daily.city)
+        if key in counts:
+            daily.views += counts.pop(key)
+            changed.append(daily)
+    PropertyViewDaily.objects.bulk_update(changed, ['views'], batch_size=500)
+    PropertyViewDaily.objects.bulk_create([
+        PropertyViewDaily(property_id=property_id, day=day, country=country, city=city, views=views)
+        for (property_id, day, country, city), views in counts.items()
+    ], batch_size=500)
+    return total
+
+
+def aggregate_views(queryset):
+    return (
+        queryset
+        .values('property_id')
+        .annotate(
+            day=TruncDate('viewed_at'),
+            view_country=Coalesce('country', Value('')),
+            view_city=Coalesce('city', Value('')),
+        )
+        .values('property_id', 'day', 'view_country', 'view_city')
+        .annotate(views=Count('id'))
+        .order_by()
+    )
+
+
+def rollup_views(batch_size=ROLLUP_BATCH_SIZE, lag=ROLLUP_LAG):
+    """Fold views newer than the watermark into the daily rollup; returns the number of views folded."""
+    RollupWatermark.objects.get_or_create(name=VIEW_ROLLUP)
+    cutoff = timezone.now() - lag
+    folded = 0
+    while True:
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=VIEW_ROLLUP)
+            ids = list(
+                PropertyView.objects.filter(id__gt=watermark.last_id, viewed_at__lte=cutoff)
+                .order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            end = ids[-1]
+            unresolved = (
+                PropertyView.objects.filter(id__gt=watermark.last_id, id__lte=end, geo_resolved=False)
+                .order_by('id').values_list('id', flat=True).first()
+            )
+            if unresolved is not None:
+                end = unresolved - 1
+                if end <= watermark.last_id:
+                    break
+
+            batch = PropertyView.objects.filter(id__gt=watermark.last_id, id__lte=end)
+            folded += _fold(aggregate_views(batch))
+            watermark.last_id = end
+            watermark.save(update_fields=['last_id', 'updated_at'])
+        if unresolved is not None:
+            break
+    return folded
+
+
+def recent_views(days=30):
+    """Subquery of a property's rolled-up views over the last ``days`` days, for annotations."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    totals = (
+        PropertyViewDaily.objects.filter(property=OuterRef('pk'), day__gte=since)
+        .values('property').annotate(total=Sum('views')).values('total')
+    )
+    return Coalesce(Subquery(totals), 0)
+
+
+def daily_view_counts(property_id, days=30):
+    """``{day: views}`` for one property over the last ``days`` days."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = (
+        PropertyViewDaily.objects.filter(property_id=property_id, day__gte=since)
+        .values('day').annotate(total=Sum('views')).order_by('day')
+    )
+    return {row['day']: row['total'] for row in rows}
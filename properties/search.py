@@ -0,0 +1,110 @@
+"""
+Full-text search for property listings.
+
+On SQLite the searchable columns are mirrored into an FTS5 virtual table
+(kept in sync by the signals in ``properties.signals``) and results are
+ranked with bm25. On PostgreSQL a weighted tsvector is ranked with
+``SearchRank``. Any other backend falls back to ``icontains`` lookups.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'properties_property_fts'
+
+# bm25 weights for the indexed columns: title, location, description
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+
+def _uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def _match_expression(text):
+    """Turn free text into an FTS5 query of prefix-matched, AND-ed terms."""
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def ensure_search_index(**kwargs):
+    """Create the FTS5 table if it is missing and fill it from the Property table."""
+    if not _uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        if cursor.fetchone():
+            return
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"title, location, description, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+    rebuild_search_index()
+
+
+def rebuild_search_index():
+    """Re-index every property. Returns the number of indexed rows."""
+    if not _uses_fts():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, location, description) "
+            f"SELECT id, title, location, description FROM properties_property"
+        )
+        return cursor.rowcount
+
+
+def index_property(property_obj):
+    if not _uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [property_obj.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, location, description) VALUES (%s, %s, %s, %s)",
+            [property_obj.pk, property_obj.title, property_obj.location, property_obj.description],
+        )
+
+
+def unindex_property(property_id):
+    if not _uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [property_id])
+
+
+def search_properties(queryset, text):
+    """
+    Filter ``queryset`` to properties matching ``text`` and annotate each
+    with ``search_rank`` (higher is more relevant).
+    """
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = (
+            SearchVector('title', weight='A')
+            + SearchVector('location', weight='B')
+            + SearchVector('description', weight='C')
+        )
+        query = SearchQuery(text, search_type='websearch')
+        return queryset.annotate(search_rank=SearchRank(vector, query)).filter(search_rank__gt=0)
+
+    match = _match_expression(text)
+    if not _uses_fts() or not match:
+        return queryset.filter(
+            Q(title__icontains=text) |
+            Q(description__icontains=text) |
+            Q(location__icontains=text)
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    matching_ids = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", (match,))
+    # bm25() is negative with lower meaning better, so flip it
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = properties_property.id",
+        (match,),
+        output_field=FloatField(),
+    )
+    return queryset.filter(id__in=matching_ids).annotate(search_rank=rank)
@@ -0,0 +1,141 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Property, PropertyImage, PropertyAmenity, Amenity, NearbyPlace, SimilarProperty, PropertyPriceHistory
+from . import search
+from .cache import bump_listing_version
+from .locations import refresh_locations
+from .suggest import suggestion_index
+from .clusters import invalidate_cluster_tiles
+from .recommendations import queue_similar_refresh
+from .renditions import enqueue_renditions
+from .matching import index_preferences, queue_match, unindex_user
+from accounts.models import UserPreferences
+
+
+def invalidate_listings():
+    """Bump the listing cache version once the current transaction commits."""
+    transaction.on_commit(bump_listing_version)
+
+
+def touch_properties(**filters):
+    """Bump `updated_at` so cached detail fragments keyed on it are re-rendered."""
+    Property.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+def sync_primary_image(property_id):
+    """Copy the current primary image of a property into `Property.primary_image`."""
+    property_obj = Property.objects.filter(pk=property_id).only('pk').first()
+    if property_obj:
+        property_obj.refresh_primary_image()
+
+
+@receiver(post_save, sender=PropertyImage)
+def property_image_saved(sender, instance, **kwargs):
+    # Renditions of a replaced file must not be served for the new one
+    if instance.renditions.get('source') != instance.image.name:
+        if instance.renditions:
+            instance.renditions = {}
+            PropertyImage.objects.filter(pk=instance.pk).update(renditions={})
+        if instance.image:
+            image_id = instance.pk
+            transaction.on_commit(lambda: enqueue_renditions(image_id))
+    sync_primary_image(instance.property_id)
+    touch_properties(pk=instance.property_id)
+    invalidate_listings()
+
+
+@receiver(post_delete, sender=PropertyImage)
+def property_image_deleted(sender, instance, **kwargs):
+    sync_primary_image(instance.property_id)
+    touch_properties(pk=instance.property_id)
+    invalidate_listings()
+
+
+@receiver(post_save, sender=PropertyAmenity)
+@receiver(post_delete, sender=PropertyAmenity)
+def property_amenity_changed(sender, instance, **kwargs):
+    touch_properties(pk=instance.property_id)
+    invalidate_listings()
+    queue_similar_refresh(instance.property_id)
+
+
+@receiver(post_save, sender=Amenity)
+def amenity_saved(sender, instance, created, **kwargs):
+    # A renamed amenity or new icon shows on every listing that has it
+    if not created:
+        touch_properties(amenities__amenity=instance)
+
+
+@receiver(post_save, sender=NearbyPlace)
+@receiver(post_delete, sender=NearbyPlace)
+def nearby_place_changed(sender, instance, **kwargs):
+    touch_properties(pk=instance.property_id)
+
+
+# Saved-preference alerts are re-evaluated when any of these change
+MATCH_FIELDS = ('type', 'location', 'price', 'status', 'is_active')
+
+
+@receiver(pre_save, sender=Property)
+def property_saving(sender, instance, **kwargs):
+    # Remember the stored location so a move refreshes both the old and new entry
+    instance._previous_location = instance._previous_geohash = None
+    instance._previous_match_fields = None
+    if instance.pk:
+        previous = Property.objects.filter(pk=instance.pk).values_list('location', 'geohash', *MATCH_FIELDS).first()
+        if previous:
+            instance._previous_location, instance._previous_geohash = previous[:2]
+            instance._previous_match_fields = previous[2:]
+
+
+@receiver(post_save, sender=Property)
+def property_saved(sender, instance, created, **kwargs):
+    search.index_property(instance)
+    invalidate_listings()
+    locations = (instance.location, getattr(instance, '_previous_location', None))
+    transaction.on_commit(lambda: refresh_locations(*locations))
+    transaction.on_commit(lambda: suggestion_index.update_property(instance))
+    geohashes = (instance.geohash, getattr(instance, '_previous_geohash', None))
+    transaction.on_commit(lambda: invalidate_cluster_tiles(*geohashes))
+    queue_similar_refresh(instance.pk)
+    previous = getattr(instance, '_previous_match_fields', None)
+    old_price = previous[MATCH_FIELDS.index('price')] if previous else None
+    if created or old_price != instance.price:
+        # Read by properties.price_alerts.send_price_drop_alerts
+        PropertyPriceHistory.objects.create(property=instance, old_price=old_price, new_price=instance.price)
+    if previous != tuple(getattr(instance, field) for field in MATCH_FIELDS):
+        queue_match(instance.pk)
+
+
+@receiver(pre_delete, sender=Property)
+def property_deleting(sender, instance, **kwargs):
+    # The cascade removes these links, so remember whose lists lose an entry
+    instance._similar_holders = list(
+        SimilarProperty.objects.filter(similar=instance).values_list('property_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Property)
+def property_deleted(sender, instance, **kwargs):
+    search.unindex_property(instance.pk)
+    invalidate_listings()
+    transaction.on_commit(lambda: refresh_locations(instance.location))
+    property_id = instance.pk
+    transaction.on_commit(lambda: suggestion_index.remove_property(property_id))
+    transaction.on_commit(lambda: invalidate_cluster_tiles(instance.geohash))
+    holders = getattr(instance, '_similar_holders', [])
+    queue_similar_refresh(property_id, *holders)
+
+
+@receiver(post_save, sender=UserPreferences)
+def user_preferences_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: index_preferences(instance))
+
+
+@receiver(post_delete, sender=UserPreferences)
+def user_preferences_deleted(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: unindex_user(user_id))
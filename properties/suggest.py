@@ -0,0 +1,159 @@
+"""
+In-process prefix index for search-box suggestions.
+
+Locations, cities, pincodes and titles of active properties are kept in
+a sorted list of normalized keys and answered with ``bisect``, so a
+lookup never touches the database. Every word of a phrase starts its own
+key, which lets "nag" match "Civil Lines, Nagpur".
+
+Each worker process holds its own copy. The writing process applies
+Property changes incrementally; the others notice the bumped version in
+the shared cache and rebuild on their next lookup.
+"""
+import bisect
+import re
+import threading
+import time
+
+from django.core.cache import cache
+
+from .models import Property
+
+SUGGEST_VERSION_KEY = 'properties:suggest_version'
+MAX_SUGGESTIONS = 10
+# Upper bound on keys inspected per lookup, so one-letter prefixes stay cheap
+MAX_SCAN = 500
+
+# Suggestion kinds in the order they are preferred for equal counts
+KINDS = ('location', 'city', 'pincode', 'title')
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def _contributions(title, location, city, pincode):
+    """The (kind, display text) entries a single property adds to the index."""
+    entries = [('location', location), ('city', city), ('pincode', pincode), ('title', title)]
+    return [(kind, text.strip()) for kind, text in entries if text and text.strip()]
+
+
+def _keys_for(text):
+    words = _normalize(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestionIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []  # sorted (key, kind, display)
+        self._entries = {}  # (kind, display) -> set of property ids
+        self._by_property = {}  # property id -> list of (kind, display)
+        self.version = None
+
+    def _add_entry(self, property_id, entry):
+        holders = self._entries.get(entry)
+        if holders is None:
+            holders = self._entries[entry] = set()
+            for key in _keys_for(entry[1]):
+                bisect.insort(self._keys, (key, *entry))
+        holders.add(property_id)
+
+    def _remove_entry(self, property_id, entry):
+        holders = self._entries.get(entry)
+        if holders is None:
+            return
+        holders.discard(property_id)
+        if not holders:
+            del self._entries[entry]
+            for key in _keys_for(entry[1]):
+                item = (key, *entry)
+                position = bisect.bisect_left(self._keys, item)
+                if position < len(self._keys) and self._keys[position] == item:
+                    del self._keys[position]
+
+    def _set_property(self, property_id, entries):
+        for entry in self._by_property.pop(property_id, []):
+            self._remove_entry(property_id, entry)
+        for entry in entries:
+            self._add_entry(property_id, entry)
+        if entries:
+            self._by_property[property_id] = entries
+
+    def rebuild(self, version=None):
+        rows = Property.objects.filter(is_active=True).values_list('id', 'title', 'location', 'city', 'pincode')
+        keys, entries, by_property = [], {}, {}
+        for property_id, *fields in rows.iterator():
+            contributions = _contributions(*fields)
+            for entry in contributions:
+                holders = entries.get(entry)
+                if holders is None:
+                    holders = entries[entry] = set()
+                    keys.extend((key, *entry) for key in _keys_for(entry[1]))
+                holders.add(property_id)
+            if contributions:
+                by_property[property_id] = contributions
+        keys.sort()
+
+        with self._lock:
+            self._keys, self._entries, self._by_property = keys, entries, by_property
+            self.version = version
+
+    def update_property(self, property_obj):
+        """Apply a saved property to the index (removing it if inactive)."""
+        entries = []
+        if property_obj.is_active:
+            entries = _contributions(
+                property_obj.title, property_obj.location, property_obj.city, property_obj.pincode
+            )
+        self._apply(property_obj.pk, entries)
+
+    def remove_property(self, property_id):
+        self._apply(property_id, [])
+
+    def _apply(self, property_id, entries):
+        with self._lock:
+            in_sync = self.version is not None
+            self._set_property(property_id, entries)
+            version = _bump_version()
+            # Only keep trusting the index if nobody else wrote in between
+            self.version = version if in_sync and version == self.version + 1 else None
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        version = _current_version()
+        if version != self.version:
+            self.rebuild(version)
+
+        with self._lock:
+            matches = {}
+            position = bisect.bisect_left(self._keys, (prefix,))
+            end = min(len(self._keys), position + MAX_SCAN)
+            while position < end and self._keys[position][0].startswith(prefix):
+                _, kind, display = self._keys[position]
+                matches[(kind, display)] = len(self._entries[(kind, display)])
+                position += 1
+
+        ranked = sorted(matches.items(), key=lambda item: (-item[1], KINDS.index(item[0][0]), item[0][1]))
+        return [{'text': display, 'type': kind, 'count': count} for (kind, display), count in ranked[:limit]]
+
+
+def _current_version():
+    version = cache.get(SUGGEST_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a lost key never matches an old index version
+        cache.add(SUGGEST_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(SUGGEST_VERSION_KEY)
+    return version
+
+
+def _bump_version():
+    try:
+        return cache.incr(SUGGEST_VERSION_KEY)
+    except ValueError:
+        return _current_version()
+
+
+suggestion_index = SuggestionIndex()
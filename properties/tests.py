@@ -1,3 +1,875 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from accounts.models import CustomUser, Notification, NotificationSettings, OutboundEmail, UserAgent, UserPreferences
+from accounts.useragents import clear_user_agent_cache, resolve_user_agent
+from agents.models import Agent
+from . import geolocation, matching, price_alerts, recommendations, renditions, retention, rollups, signals, tracking, views
+from .cache import get_listing_version
+from .locations import location_counts
+from .models import Amenity, SavedProperty, NearbyPlace, Property, PropertyAmenity, PropertyImage, PropertyView, PropertyViewDaily, PreferenceKey, PropertyMatch, PropertyPriceHistory, RollupWatermark, SimilarProperty
+
+
+def create_agent():
+    return Agent.objects.create(
+        name='Test Agent',
+        title='Senior Agent',
+        description='Test agent',
+        phone='9999999999',
+        email='agent@example.com',
+        experience=5,
+    )
+
+
+def create_property(agent, **kwargs):
+    data = {
+        'title': 'Test Property',
+        'description': 'A test property',
+        'status': 'for_sale',
+        'type': 'apartment',
+        'price': 5000000,
+        'location': 'Civil Lines, Nagpur',
+        'pincode': '440001',
+        'total_area': 1200,
+        'bedrooms': 2,
+        'bathrooms': 2,
+        'year_built': 2020,
+        'agent': agent,
+    }
+    data.update(kwargs)
+    return Property.objects.create(**data)
+
+
+class PropertyTestCase(TestCase):
+    """Starts every test with empty caches so cached listings never leak between tests."""
+
+    def setUp(self):
+        cache.clear()
+        # Renditions are built explicitly where a test needs them
+        patcher = mock.patch.object(signals, 'enqueue_renditions')
+        self.enqueue_renditions = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Similar-property refreshes and matching run when a test asks, not on a thread
+        self.similar_refresher = recommendations.SimilarRefresher(background=False)
+        patcher = mock.patch.object(recommendations, 'similar_refresher', self.similar_refresher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.property_matcher = matching.PropertyMatcher(background=False)
+        patcher = mock.patch.object(matching, 'property_matcher', self.property_matcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class GetPropertiesQueryCountTests(PropertyTestCase):
+    """The listing endpoint must not issue a query per card."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = create_agent()
+
+    def add_properties(self, count):
+        for i in range(count):
+            prop = create_property(self.agent, title=f'Property {i}')
+            PropertyImage.objects.create(property=prop, image=f'property_images/{i}.jpg', is_primary=True)
+            PropertyImage.objects.create(property=prop, image=f'property_images/{i}-b.jpg', order=1)
+
+    def assert_listing_queries(self, expected_cards):
+        # COUNT for the paginator and the page itself; images come from the cached column
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('properties:get_properties'))
+        self.assertEqual(len(response.json()['properties']), expected_cards)
+        return response
+
+    def test_constant_queries_for_small_page(self):
+        self.add_properties(2)
+        self.assert_listing_queries(2)
+
+    def test_constant_queries_for_full_page(self):
+        self.add_properties(9)
+        response = self.assert_listing_queries(9)
+        for card in response.json()['properties']:
+            self.assertIn('/media/property_images/', card['image'])
+            self.assertFalse(card['image'].endswith('-b.jpg'))
+
+
+class PrimaryImageSyncTests(PropertyTestCase):
+    """`Property.primary_image` follows PropertyImage writes."""
+
+    def setUp(self):
+        super().setUp()
+        self.property = create_property(create_agent())
+
+    def test_primary_image_follows_image_writes(self):
+        image = PropertyImage.objects.create(property=self.property, image='property_images/a.jpg', is_primary=True)
+        self.property.refresh_from_db()
+        self.assertEqual(self.property.primary_image.name, 'property_images/a.jpg')
+
+        image.delete()
+        self.property.refresh_from_db()
+        self.assertFalse(self.property.primary_image)
+        self.assertIn('placeholder', self.property.image_url)
+
+
+class PropertySearchTests(PropertyTestCase):
+    """Search goes through the full-text index and can be sorted by rank."""
+
+    @classmethod
+    def setUpTestData(cls):
+        agent = create_agent()
+        cls.title_match = create_property(agent, title='Lakeside Villa', description='Quiet street')
+        cls.body_match = create_property(agent, title='Family Home', description='Close to the lakeside park')
+        create_property(agent, title='City Office', description='Downtown tower')
+
+    def search(self, **params):
+        response = self.client.get(reverse('properties:get_properties'), params)
+        return [card['id'] for card in response.json()['properties']]
+
+    def test_search_matches_indexed_columns(self):
+        ids = self.search(search='lakeside')
+        self.assertCountEqual(ids, [self.title_match.id, self.body_match.id])
+
+    def test_rank_sort_prefers_title_matches(self):
+        ids = self.search(search='lakeside', sort='rank')
+        self.assertEqual(ids, [self.title_match.id, self.body_match.id])
+
+    def test_index_follows_edits(self):
+        self.body_match.description = 'Close to the river'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.body_match.save()
+        self.assertEqual(self.search(search='lakeside'), [self.title_match.id])
+
+
+class CursorPaginationTests(PropertyTestCase):
+    """`?cursor=` pages by sort key without OFFSET or COUNT."""
+
+    @classmethod
+    def setUpTestData(cls):
+        agent = create_agent()
+        # Repeated prices and titles exercise the id tie-breaker
+        cls.ids = [
+            create_property(agent, title=f'Home {i % 4}', price=1000000 * (i % 5 + 1)).id
+            for i in range(20)
+        ]
+
+    def walk(self, sort):
+        seen, cursor, pages = [], '', 0
+        while cursor is not None:
+            with self.assertNumQueries(1):
+                data = self.client.get(reverse('properties:get_properties'), {'cursor': cursor, 'sort': sort}).json()
+            seen.extend(card['id'] for card in data['properties'])
+            cursor = data['next_cursor']
+            pages += 1
+        return seen, pages
+
+    def test_cursor_walk_matches_paginated_order(self):
+        for sort in ('newest', 'price-low', 'price-high', 'name'):
+            seen, pages = self.walk(sort)
+            self.assertEqual(pages, 3)
+            expected = []
+            for page in (1, 2, 3):
+                data = self.client.get(reverse('properties:get_properties'), {'page': page, 'sort': sort}).json()
+                expected.extend(card['id'] for card in data['properties'])
+            self.assertEqual(seen, expected, sort)
+            self.assertCountEqual(seen, self.ids)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('properties:get_properties'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+
+class ListingCacheTests(PropertyTestCase):
+    """Listing responses are cached until a catalogue write bumps the version."""
+
+    def setUp(self):
+        super().setUp()
+        self.property = create_property(create_agent())
+        self.url = reverse('properties:get_properties')
+
+    def test_repeated_request_hits_cache(self):
+        self.client.get(self.url, {'status': 'for_sale'})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'status': 'for_sale', 'search': ''})
+        self.assertEqual(response.json()['total_properties'], 1)
+
+    def test_write_invalidates_cached_pages(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.property.title = 'Renamed'
+            self.property.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['properties'][0]['title'], 'Renamed')
+
+    def test_image_write_invalidates_cached_pages(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            PropertyImage.objects.create(property=self.property, image='property_images/new.jpg', is_primary=True)
+        response = self.client.get(self.url)
+        self.assertTrue(response.json()['properties'][0]['image'].endswith('new.jpg'))
+
+
+class LocationDictionaryTests(PropertyTestCase):
+    """The location dropdown is served from a cached, incrementally refreshed dictionary."""
+
+    def setUp(self):
+        super().setUp()
+        agent = create_agent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = create_property(agent, location='Dharampeth')
+            create_property(agent, location='Dharampeth')
+
+    def test_property_list_renders_locations_without_queries(self):
+        self.client.get(reverse('properties:property_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('properties:property_list'))
+        self.assertEqual(response.context['locations'], ['Dharampeth'])
+
+    def test_counts_follow_writes(self):
+        self.assertEqual(location_counts(), {'Dharampeth': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.location = 'Sadar'
+            self.first.save()
+        self.assertEqual(location_counts(), {'Dharampeth': 1, 'Sadar': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.is_active = False
+            self.first.save()
+        self.assertEqual(location_counts(), {'Dharampeth': 1})
+
+
+class SuggestTests(PropertyTestCase):
+    """The typeahead endpoint answers from the in-process prefix index."""
+
+    def setUp(self):
+        super().setUp()
+        agent = create_agent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.villa = create_property(agent, title='Garden Villa', location='Civil Lines, Nagpur', pincode='440001')
+            create_property(agent, title='City Flat', location='Civil Lines, Nagpur', pincode='440002')
+        self.url = reverse('properties:suggest')
+
+    def suggest(self, query):
+        return self.client.get(self.url, {'q': query}).json()['suggestions']
+
+    def test_matches_any_word_prefix_without_queries(self):
+        self.suggest('warm up')
+        with self.assertNumQueries(0):
+            suggestions = self.suggest('nag')
+        self.assertEqual(suggestions[0], {'text': 'Civil Lines, Nagpur', 'type': 'location', 'count': 2})
+        self.assertIn({'text': '440001', 'type': 'pincode', 'count': 1}, self.suggest('4400'))
+
+    def test_index_follows_writes(self):
+        self.suggest('warm up')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.villa.title = 'Lake Villa'
+            self.villa.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('garden'), [])
+            self.assertEqual(self.suggest('lake')[0]['text'], 'Lake Villa')
+
+
+class FacetCountTests(PropertyTestCase):
+    """`?facets=1` adds per-filter counts from a single aggregate query."""
+
+    @classmethod
+    def setUpTestData(cls):
+        agent = create_agent()
+        create_property(agent, status='for_sale', type='villa', bedrooms=3, price=1500000)
+        create_property(agent, status='for_sale', type='apartment', bedrooms=2, price=3000000)
+        create_property(agent, status='for_rent', type='apartment', bedrooms=5, price=25000)
+        create_property(agent, status='for_sale', type='villa', bedrooms=4, price=1500000, is_active=False)
+
+    def get_facets(self, **params):
+        return self.client.get(reverse('properties:get_properties'), {'facets': '1', **params}).json()['facets']
+
+    def test_facets_cost_one_extra_query(self):
+        with self.assertNumQueries(3):
+            facets = self.get_facets()
+        self.assertEqual(facets['status']['for_sale'], 2)
+        self.assertEqual(facets['type']['apartment'], 2)
+        self.assertEqual(facets['bedrooms'], {'1': 0, '2': 1, '3': 1, '4': 1})
+        self.assertEqual(facets['price']['0-20'], 2)
+
+    def test_facet_ignores_its_own_filter(self):
+        facets = self.get_facets(type='apartment')
+        self.assertEqual(facets['type'], {'apartment': 2, 'villa': 1, 'house': 0, 'commercial': 0, 'land': 0, 'office': 0, 'shop': 0})
+        self.assertEqual(facets['status'], {'for_sale': 1, 'for_rent': 1, 'sold': 0, 'rented': 0})
+
+
+class GeoSearchTests(PropertyTestCase):
+    """Radius and viewport searches go through the geohash column."""
+
+    @classmethod
+    def setUpTestData(cls):
+        agent = create_agent()
+        # Civil Lines, Sitabuldi (about 1.5 km away) and Mumbai
+        cls.civil_lines = create_property(agent, title='Civil Lines', latitude='21.1537', longitude='79.0729')
+        cls.sitabuldi = create_property(agent, title='Sitabuldi', latitude='21.1430', longitude='79.0800')
+        cls.mumbai = create_property(agent, title='Mumbai', latitude='19.0760', longitude='72.8777')
+        create_property(agent, title='No coordinates')
+
+    def test_geohash_is_stored(self):
+        self.assertEqual(self.mumbai.geohash[:5], 'te7ud')
+        self.assertEqual(Property.objects.get(title='No coordinates').geohash, '')
+
+    def test_radius_search_sorted_by_distance(self):
+        response = self.client.get(reverse('properties:get_properties'), {
+            'lat': '21.1458', 'lng': '79.0882', 'radius': '5', 'sort': 'distance',
+        })
+        cards = response.json()['properties']
+        self.assertEqual([card['id'] for card in cards], [self.sitabuldi.id, self.civil_lines.id])
+        self.assertLess(cards[0]['distance_km'], cards[1]['distance_km'])
+        self.assertLess(cards[1]['distance_km'], 5)
+
+    def test_map_bounds(self):
+        response = self.client.get(reverse('properties:map_properties'), {'bbox': '21.0,79.0,21.3,79.2'})
+        pins = response.json()['pins']
+        self.assertCountEqual([pin['id'] for pin in pins], [self.civil_lines.id, self.sitabuldi.id])
+        for bbox in ('nope', '21.0,79.0,21.3', 'nan,79.0,21.3,79.2', '21.0,79.0,inf,79.2', '-91,79.0,21.3,79.2', '21.3,79.0,21.0,79.2', '21.0,79.2,21.3,79.0'):
+            bad = self.client.get(reverse('properties:map_properties'), {'bbox': bbox})
+            self.assertEqual(bad.status_code, 400, bbox)
+
+
+class MapClusterTests(PropertyTestCase):
+    """Cluster tiles are cached until a write lands inside them."""
+
+    def setUp(self):
+        super().setUp()
+        agent = create_agent()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first = create_property(agent, latitude='21.1537', longitude='79.0729', price=3000000)
+            create_property(agent, latitude='21.1540', longitude='79.0730', price=5000000)
+            self.mumbai = create_property(agent, latitude='19.0760', longitude='72.8777')
+        self.url = reverse('properties:map_clusters')
+        self.params = {'bbox': '21.0,78.9,21.3,79.3', 'zoom': '10'}
+
+    def test_clusters_are_cached_per_tile(self):
+        clusters = self.client.get(self.url, self.params).json()['clusters']
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(clusters[0]['count'], 2)
+        self.assertEqual((clusters[0]['min_price'], clusters[0]['max_price']), (3000000, 5000000))
+        with self.assertNumQueries(0):
+            self.client.get(self.url, self.params)
+
+    def test_write_invalidates_only_its_tiles(self):
+        self.client.get(self.url, self.params)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mumbai.price = 1
+            self.mumbai.save()
+        with self.assertNumQueries(0):
+            self.client.get(self.url, self.params)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.is_active = False
+            self.first.save()
+        clusters = self.client.get(self.url, self.params).json()['clusters']
+        self.assertEqual(clusters[0]['count'], 1)
+
+    def test_geohash_backfill_drops_cached_tiles(self):
+        Property.objects.filter(pk=self.first.pk).update(geohash='')
+        self.assertEqual(self.client.get(self.url, self.params).json()['clusters'][0]['count'], 1)
+        version = get_listing_version()
+        call_command('backfill_geohashes', stdout=io.StringIO())
+        self.assertNotEqual(get_listing_version(), version)
+        self.assertEqual(self.client.get(self.url, self.params).json()['clusters'][0]['count'], 2)
+
+    def test_invalid_viewport_is_rejected(self):
+        for bbox in ('nan,78.9,21.3,79.3', '21.0,-inf,21.3,79.3', '21.0,78.9,95,79.3', '21.3,78.9,21.0,79.3'):
+            response = self.client.get(self.url, {'bbox': bbox, 'zoom': '10'})
+            self.assertEqual(response.status_code, 400, bbox)
+
+
+class GeolocationTests(PropertyTestCase):
+    """Views are recorded at once and geolocated later through a cached resolver."""
+
+    def setUp(self):
+        super().setUp()
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        handle.write(
+            'ip_from,ip_to,country,region,city,latitude,longitude,isp\n'
+            '1.2.3.0,1.2.3.255,India,Maharashtra,Nagpur,21.1458,79.0882,Test ISP\n'
+        )
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        self.database = handle.name
+        self.property = create_property(create_agent())
+
+    def test_offline_resolver_with_prefix_cache(self):
+        offline = geolocation.OfflineResolver(self.database)
+        resolver = geolocation.CachedResolver(offline)
+        with mock.patch.object(offline, 'resolve', wraps=offline.resolve) as resolve:
+            self.assertEqual(resolver.resolve('1.2.3.4')['city'], 'Nagpur')
+            self.assertEqual(resolver.resolve('1.2.3.200')['city'], 'Nagpur')
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(offline.resolve('8.8.8.8'), {})
+
+    def test_detail_view_only_buffers_the_event(self):
+        with mock.patch.object(views, 'record_view') as record:
+            self.client.get(reverse('properties:property_detail', args=[self.property.id]),
+                            REMOTE_ADDR='1.2.3.4', HTTP_USER_AGENT='Test')
+        record.assert_called_once_with(self.property.id, '1.2.3.4', 'Test')
+        self.assertFalse(PropertyView.objects.exists())
+
+    def test_buffer_flushes_in_one_batch_and_geolocates(self):
+        buffer = tracking.ViewBuffer(size=1000, interval=3600, geo_worker=False)
+        for ip in ('1.2.3.4', '1.2.3.5', '127.0.0.1'):
+            buffer.add(self.property.id, ip, 'Mozilla/5.0')
+        self.assertEqual(buffer.pending(), 3)
+        # The test's rollback undoes this "commit", so don't leak the cached id
+        self.addCleanup(clear_user_agent_cache)
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_user_agent('Mozilla/5.0')
+        with override_settings(IP_GEOLOCATION_RESOLVER='properties.geolocation.OfflineResolver',
+                               IP_GEOLOCATION_DATABASE=self.database), \
+                mock.patch.object(geolocation, '_resolver', None):
+            with self.assertNumQueries(3):  # one INSERT in a savepoint
+                self.assertEqual(buffer.flush(), 3)
+            self.assertFalse(PropertyView.objects.filter(geo_resolved=True).exists())
+            with self.assertNumQueries(1):  # one UPDATE, off the flush path
+                self.assertTrue(buffer.geolocate_queued())
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(PropertyView.objects.filter(geo_resolved=True, city='Nagpur').count(), 2)
+        self.assertEqual(UserAgent.objects.count(), 1)
+        self.assertIsNone(PropertyView.objects.get(ip_address='127.0.0.1').city)
+
+    def test_connection_errors_keep_the_batch_and_buffer_is_capped(self):
+        buffer = tracking.ViewBuffer(size=1000, interval=3600, max_pending=3, geo_worker=False)
+        for i in range(5):
+            buffer.add(self.property.id, f'1.2.3.{i}')
+        self.assertEqual(buffer.pending(), 3)
+        with mock.patch.object(tracking, 'resolve_user_agent', side_effect=tracking.OperationalError('gone')), \
+                self.assertLogs('properties.tracking', 'WARNING'):
+            self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(), 3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(sorted(PropertyView.objects.values_list('ip_address', flat=True)), ['1.2.3.2', '1.2.3.3', '1.2.3.4'])
+
+    def test_failed_lookups_are_retried(self):
+        upstream = mock.Mock()
+        upstream.resolve.side_effect = [None, {'city': 'Nagpur'}]
+        resolver = geolocation.CachedResolver(upstream)
+        self.assertIsNone(resolver.resolve('1.2.3.4'))
+        self.assertEqual(resolver.resolve('1.2.3.9')['city'], 'Nagpur')
+
+        view = PropertyView.objects.create(property=self.property, ip_address='1.2.3.4')
+        with mock.patch.object(geolocation, 'lookup', return_value=None):
+            self.assertEqual(geolocation.geolocate_views([view]), 0)
+        self.assertFalse(PropertyView.objects.get(pk=view.pk).geo_resolved)
+
+    def test_views_failing_for_too_long_are_given_up(self):
+        old = PropertyView.objects.create(
+            property=self.property, ip_address='1.2.3.4', city='Stale', viewed_at=timezone.now() - timedelta(days=2)
+        )
+        with mock.patch.object(geolocation, 'lookup', return_value=None), self.assertLogs('properties.geolocation', 'WARNING'):
+            self.assertEqual(geolocation.geolocate_views([old]), 1)
+        old.refresh_from_db()
+        self.assertTrue(old.geo_resolved)
+        self.assertIsNone(old.city)
+        # No longer holds up the rollup
+        self.assertEqual(rollups.rollup_views(), 1)
+        self.assertEqual(PropertyViewDaily.objects.get().city, '')
+
+    def test_command_reports_unreadable_database(self):
+        with override_settings(IP_GEOLOCATION_RESOLVER='properties.geolocation.OfflineResolver',
+                               IP_GEOLOCATION_DATABASE='/nonexistent/ip.csv'), \
+                mock.patch.object(geolocation, '_resolver', None):
+            with self.assertRaisesMessage(CommandError, '/nonexistent/ip.csv'):
+                call_command('geolocate_property_views', stdout=io.StringIO())
+
+    def test_command_resolves_pending_views(self):
+        PropertyView.objects.create(property=self.property, ip_address='1.2.3.4')
+        PropertyView.objects.create(property=self.property, ip_address='127.0.0.1')
+        with override_settings(IP_GEOLOCATION_RESOLVER='properties.geolocation.OfflineResolver',
+                               IP_GEOLOCATION_DATABASE=self.database), \
+                mock.patch.object(geolocation, '_resolver', None):
+            call_command('geolocate_property_views', stdout=io.StringIO())
+        self.assertFalse(PropertyView.objects.filter(geo_resolved=False).exists())
+        self.assertEqual(PropertyView.objects.get(ip_address='1.2.3.4').city, 'Nagpur')
+        self.assertIsNone(PropertyView.objects.get(ip_address='127.0.0.1').city)
+
+
+class ViewBufferRejectionTests(TransactionTestCase):
+    """Foreign keys are checked at commit, so this needs real transactions."""
+
+    def tearDown(self):
+        # The table flush between tests bypasses the delete signal that evicts ids
+        clear_user_agent_cache()
+
+    def test_rejected_rows_are_dropped_not_retried(self):
+        prop = create_property(create_agent())
+        buffer = tracking.ViewBuffer(size=1000, interval=3600, geo_worker=False)
+        buffer.add(prop.id, '1.2.3.4')
+        buffer.add(prop.id + 1000, '1.2.3.5')  # deleted before the flush
+        buffer.add(prop.id, '1.2.3.6')
+        with self.assertLogs('properties.tracking', 'WARNING'):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(PropertyView.objects.count(), 2)
+
+
+class ViewRollupTests(PropertyTestCase):
+    """Daily rollups only read views added since the last run."""
+
+    def setUp(self):
+        super().setUp()
+        self.property = create_property(create_agent())
+
+    def view(self, city='Nagpur', **kwargs):
+        kwargs.setdefault('viewed_at', timezone.now() - timedelta(minutes=5))
+        return PropertyView.objects.create(
+            property=self.property, ip_address='1.2.3.4', country='India', city=city, geo_resolved=True, **kwargs
+        )
+
+    def test_incremental_rollup(self):
+        self.view()
+        self.view()
+        self.view(city=None)
+        self.assertEqual(rollups.rollup_views(), 3)
+        latest = self.view()
+        self.assertEqual(rollups.rollup_views(), 1)
+        self.assertEqual(RollupWatermark.objects.get(name=rollups.VIEW_ROLLUP).last_id, latest.pk)
+        self.assertEqual(rollups.rollup_views(), 0)
+        rows = {(row.city, row.views) for row in PropertyViewDaily.objects.all()}
+        self.assertEqual(rows, {('Nagpur', 3), ('', 1)})
+        self.assertEqual(sum(rollups.daily_view_counts(self.property.id).values()), 4)
+
+    def test_rollup_waits_for_geolocation(self):
+        self.view()
+        pending = PropertyView.objects.create(
+            property=self.property, ip_address='1.2.3.4', viewed_at=timezone.now() - timedelta(minutes=5)
+        )
+        self.view()
+        self.assertEqual(rollups.rollup_views(), 1)
+        PropertyView.objects.filter(pk=pending.pk).update(city='Pune', country='India', geo_resolved=True)
+        self.assertEqual(rollups.rollup_views(), 2)
+        self.assertEqual(PropertyViewDaily.objects.get(city='Pune').views, 1)
+
+    def test_recent_views_wait_for_the_next_run(self):
+        self.view()
+        recent = self.view(viewed_at=timezone.now())
+        self.assertEqual(rollups.rollup_views(), 1)
+        self.assertEqual(rollups.rollup_views(lag=timedelta(0)), 1)
+        self.assertEqual(RollupWatermark.objects.get(name=rollups.VIEW_ROLLUP).last_id, recent.pk)
+
+
+class ViewRetentionTests(PropertyTestCase):
+    """Expired views are rolled up, archived per day and deleted."""
+
+    def test_prune_archives_rolled_up_views(self):
+        property_obj = create_property(create_agent())
+        old = timezone.now() - timedelta(days=120)
+        for _ in range(3):
+            PropertyView.objects.create(property=property_obj, ip_address='1.2.3.4', viewed_at=old, geo_resolved=True)
+        PropertyView.objects.create(property=property_obj, ip_address='1.2.3.4', geo_resolved=True)
+        unresolved = PropertyView.objects.create(property=property_obj, ip_address='1.2.3.4', viewed_at=old)
+
+        with tempfile.TemporaryDirectory() as archive_dir:
+            deleted = retention.prune_views(days=90, batch_size=2, archive_dir=archive_dir)
+            path = retention.archive_path(archive_dir, timezone.localtime(old).date())
+            with gzip.open(path, 'rt', newline='') as handle:
+                archived = list(csv.DictReader(handle))
+
+        self.assertEqual(deleted, 3)
+        self.assertEqual(len(archived), 3)
+        self.assertEqual(PropertyView.objects.count(), 2)
+        self.assertTrue(PropertyView.objects.filter(pk=unresolved.pk).exists())
+        self.assertEqual(PropertyViewDaily.objects.get(day=timezone.localtime(old).date()).views, 3)
+
+
+class SimilarPropertyTests(PropertyTestCase):
+    """Neighbours are precomputed and follow listing changes."""
+
+    def setUp(self):
+        super().setUp()
+        agent = create_agent()
+        self.base = create_property(agent, property_id='S1', price=5000000, bedrooms=2)
+        self.close = create_property(agent, property_id='S2', price=5200000, bedrooms=2)
+        self.pricier = create_property(agent, property_id='S3', price=9000000, bedrooms=3)
+        self.villa = create_property(agent, property_id='S4', type='villa', price=5000000, bedrooms=2)
+        self.rental = create_property(agent, property_id='S5', status='for_rent', price=25000, bedrooms=2)
+        recommendations.rebuild_similar()
+
+    def similar_ids(self, property_obj):
+        return list(SimilarProperty.objects.filter(property=property_obj).values_list('similar_id', flat=True))
+
+    def test_ranks_closest_listing_first(self):
+        ranked = self.similar_ids(self.base)
+        self.assertEqual(ranked[0], self.close.id)
+        self.assertEqual(ranked[-1], self.rental.id)
+        with mock.patch.object(views, 'record_view'):
+            response = self.client.get(reverse('properties:property_detail', args=[self.base.id]))
+        self.assertEqual([p.id for p in response.context['similar_properties']], ranked[:3])
+
+    def test_changes_refresh_affected_lists(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pricier.price = 5000000
+            self.pricier.bedrooms = 2
+            self.pricier.save()
+        self.similar_refresher.run_pending()
+        self.assertEqual(self.similar_ids(self.base)[0], self.pricier.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pricier.is_active = False
+            self.pricier.save()
+        self.similar_refresher.run_pending()
+        self.assertNotIn(self.pricier.id, self.similar_ids(self.base))
+        self.assertFalse(SimilarProperty.objects.filter(property=self.pricier).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.close.delete()
+        self.similar_refresher.run_pending()
+        self.assertEqual(self.similar_ids(self.base), [self.villa.id, self.rental.id])
+
+    def test_writes_only_queue_ids(self):
+        amenities = [Amenity.objects.create(name=f'Amenity {i}') for i in range(5)]
+        with mock.patch.object(recommendations, 'refresh_similar') as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.base.save()
+                for amenity in amenities:
+                    PropertyAmenity.objects.create(property=self.base, amenity=amenity)
+            refresh.assert_not_called()
+            self.assertEqual(self.similar_refresher.pending(), {self.base.id})
+            self.similar_refresher.run_pending()
+        refresh.assert_called_once_with(self.base.id)
+
+
+class DetailQueryBudgetTests(PropertyTestCase):
+    """The detail page costs a fixed number of queries, however much a listing has."""
+
+    def setUp(self):
+        super().setUp()
+        agent = create_agent()
+        self.property = create_property(agent)
+        for index in range(4):
+            PropertyImage.objects.create(property=self.property, image=f'property_images/{index}.jpg', order=index)
+            amenity = Amenity.objects.create(name=f'Amenity {index}')
+            PropertyAmenity.objects.create(property=self.property, amenity=amenity)
+            NearbyPlace.objects.create(property=self.property, name=f'Place {index}', category='school', distance='1 km')
+            similar = create_property(agent, property_id=f'D{index}')
+            similar.refresh_primary_image()
+        recommendations.rebuild_similar()
+
+    def test_query_budget(self):
+        url = reverse('properties:property_detail', args=[self.property.id])
+        # property + agent, images, amenities + amenity, nearby places, similar listings
+        with mock.patch.object(views, 'record_view'), self.assertNumQueries(5):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['similar_properties']), 3)
+        self.assertEqual(len(response.context['property'].gallery_images), 4)
+        self.assertContains(response, 'Amenity 3')
+        self.assertContains(response, 'Place 3')
+
+    def test_cached_fragments_skip_content_queries(self):
+        url = reverse('properties:property_detail', args=[self.property.id])
+        with mock.patch.object(views, 'record_view'):
+            self.client.get(url)
+            # property + agent, similar listings; gallery and body come from the cache
+            with self.assertNumQueries(2):
+                response = self.client.get(url)
+            self.assertContains(response, 'Amenity 3')
+
+            with self.captureOnCommitCallbacks(execute=True):
+                PropertyImage.objects.create(property=self.property, image='property_images/new.jpg', order=9)
+                NearbyPlace.objects.filter(property=self.property, name='Place 0').delete()
+            response = self.client.get(url)
+        self.assertContains(response, 'property_images/new.jpg')
+        self.assertNotContains(response, 'Place 0')
+
+
+class ImageRenditionTests(PropertyTestCase):
+    """Uploads get content-hashed WebP/AVIF renditions at fixed widths."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.property = create_property(create_agent())
+
+    def upload(self, width=1200, height=800):
+        content = io.BytesIO()
+        Image.new('RGB', (width, height), (200, 120, 40)).save(content, format='JPEG')
+        return default_storage.save('property_images/upload.jpg', ContentFile(content.getvalue()))
+
+    def test_renditions_for_primary_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = PropertyImage.objects.create(property=self.property, image=self.upload(), is_primary=True)
+        self.enqueue_renditions.assert_called_once_with(image.pk)
+
+        self.assertTrue(renditions.build_renditions(image.pk))
+        image.refresh_from_db()
+        self.assertEqual(image.renditions['source'], image.image.name)
+        self.assertEqual([width for width, _ in image.renditions['webp']], [160, 480, 960, 1200])
+        for _, name in image.renditions['webp']:
+            self.assertRegex(name, r'^property_images/renditions/[0-9a-f]{20}-\d+\.webp$')
+            self.assertTrue(default_storage.exists(name))
+        self.assertIn('160w', image.webp_srcset())
+
+        card = self.client.get(reverse('properties:get_properties')).json()['properties'][0]
+        self.assertEqual(card['image_srcset'], image.webp_srcset())
+
+        # Same pixels, same names: nothing new is written
+        first = dict(image.renditions)
+        renditions.build_renditions(image.pk)
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, first)
+
+    def test_replacing_the_file_drops_old_renditions(self):
+        image = PropertyImage.objects.create(property=self.property, image=self.upload(), is_primary=True)
+        renditions.build_renditions(image.pk)
+        image.refresh_from_db()
+        image.image = self.upload(width=300, height=200)
+        image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.renditions, {})
+        renditions.build_renditions(image.pk)
+        image.refresh_from_db()
+        self.assertEqual([width for width, _ in image.renditions['webp']], [160, 300])
+
+
+class PreferenceMatchingTests(PropertyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.agent = create_agent()
+
+    def add_user(self, name, **preferences):
+        user = CustomUser.objects.create_user(username=name, email=f'{name}@example.com', password=None, first_name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            UserPreferences.objects.create(user=user, **preferences)
+        return user
+
+    def create(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            prop = create_property(self.agent, **kwargs)
+        self.property_matcher.run_pending()
+        return prop
+
+    def test_index_expands_preferences(self):
+        user = self.add_user('asha', property_types=['Apartment', 'Independent House'], preferred_locations=['Civil Lines'], min_budget=3000000, max_budget=6000000)
+        keys = set(PreferenceKey.objects.filter(user=user).values_list('type', 'location', 'band'))
+        self.assertEqual(keys, {(t, 'civil lines', b) for t in ('apartment', 'house') for b in (4, 5)})
+
+    def test_new_listing_notifies_matching_users_once(self):
+        asha = self.add_user('asha', property_types=['Apartment'], preferred_locations=['Civil Lines'], max_budget=6000000)
+        anyone = self.add_user('ravi')
+        self.add_user('too_poor', max_budget=1000000)
+        self.add_user('villa_only', property_types=['Villa'])
+        self.add_user('renter', interest_buying=False, interest_renting=True)
+        quiet = self.add_user('quiet', preferred_locations=['Civil Lines'])
+        NotificationSettings.objects.create(user=quiet, email_new_listings=False)
+
+        prop = self.create(title='Civil Lines 2BHK')
+        notified = set(Notification.objects.filter(type='property_match').values_list('user__username', flat=True))
+        self.assertEqual(notified, {'asha', 'ravi', 'quiet'})
+        self.assertEqual(
+            sorted(OutboundEmail.objects.values_list('to', flat=True)),
+            [['asha@example.com'], ['ravi@example.com']],
+        )
+
+        # Edits re-check the listing but never repeat an announcement
+        prop.price = 900000
+        with self.captureOnCommitCallbacks(execute=True):
+            prop.save()
+        self.property_matcher.run_pending()
+        self.assertEqual(Notification.objects.filter(type='property_match').count(), 4)
+        self.assertEqual(set(PropertyMatch.objects.values_list('user__username', flat=True)), {'asha', 'ravi', 'quiet', 'too_poor'})
+        self.assertIn(asha.id, matching.candidate_users(prop))
+        self.assertIn(anyone.id, matching.candidate_users(prop))
+
+    def test_saves_only_queue_the_listing(self):
+        self.add_user('ravi')
+        with mock.patch.object(matching, 'match_property', wraps=matching.match_property) as match:
+            with self.captureOnCommitCallbacks(execute=True):
+                prop = create_property(self.agent)
+                prop.title = 'Renamed'
+                prop.price = 4000000
+                prop.save()
+            match.assert_not_called()
+            self.assertEqual(self.property_matcher.pending(), {prop.id})
+            self.assertEqual(self.property_matcher.run_pending(), 1)
+        match.assert_called_once()
+        self.assertEqual(Notification.objects.filter(type='property_match').count(), 1)
+
+    def test_concurrent_runs_announce_each_match_once(self):
+        ravi = self.add_user('ravi')
+        prop = create_property(self.agent)
+        # A second run that picked its candidates before the first recorded them
+        self.assertEqual(matching._announce(prop, [ravi.id]), 1)
+        self.assertEqual(matching._announce(prop, [ravi.id]), 0)
+        self.assertEqual(Notification.objects.filter(type='property_match').count(), 1)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+    def test_cost_follows_candidates_not_users(self):
+        for i in range(20):
+            self.add_user(f'villa{i}', property_types=['Villa'])
+        prop = create_property(self.agent, type='shop')
+        # Only the index lookup runs when nobody can match
+        with self.assertNumQueries(1):
+            self.assertEqual(matching.match_property(prop), 0)
+
+    def test_rebuild_command(self):
+        self.add_user('asha', preferred_locations=['Civil Lines', 'Sadar'])
+        PreferenceKey.objects.all().delete()
+        call_command('rebuild_preference_index', stdout=io.StringIO())
+        self.assertEqual(PreferenceKey.objects.count(), 2)
+
+
+class PriceDropAlertTests(PropertyTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.prop = create_property(create_agent(), price=5000000)
+        cls.holders = []
+        for name in ('asha', 'ravi', 'quiet'):
+            user = CustomUser.objects.create_user(username=name, email=f'{name}@example.com', password=None, first_name=name)
+            SavedProperty.objects.create(user=user, property=cls.prop)
+            cls.holders.append(user)
+        NotificationSettings.objects.create(user=cls.holders[2], email_price_drop_alerts=False)
+
+    def reprice(self, price):
+        self.prop.price = price
+        self.prop.save()
+
+    def test_history_records_price_changes(self):
+        self.prop.title = 'Renamed'
+        self.prop.save()
+        self.reprice(4500000)
+        self.assertEqual(
+            list(PropertyPriceHistory.objects.order_by('id').values_list('old_price', 'new_price')),
+            [(None, 5000000), (5000000, 4500000)],
+        )
+
+    def test_drop_alerts_opted_in_holders_once(self):
+        self.reprice(4800000)
+        self.reprice(4500000)
+        # Alerting costs the same however many users saved the listing
+        with self.assertNumQueries(16):
+            self.assertEqual(price_alerts.send_price_drop_alerts(lag=timedelta(0)), 2)
+        alerts = Notification.objects.filter(type='price_drop')
+        self.assertEqual(set(alerts.values_list('user__username', flat=True)), {'asha', 'ravi'})
+        self.assertIn('now ₹4,500,000 (was ₹5,000,000)', alerts.first().message)
+        self.assertEqual(OutboundEmail.objects.count(), 2)
+
+        self.assertEqual(price_alerts.send_price_drop_alerts(lag=timedelta(0)), 0)
+        self.reprice(4900000)
+        self.assertEqual(price_alerts.send_price_drop_alerts(lag=timedelta(0)), 0)
+
+    def test_recent_changes_wait_for_the_next_run(self):
+        self.reprice(4500000)
+        self.assertEqual(price_alerts.send_price_drop_alerts(), 0)
+        self.assertEqual(RollupWatermark.objects.get(name=price_alerts.PRICE_ALERTS).last_id, 0)
+        PropertyPriceHistory.objects.update(changed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(price_alerts.send_price_drop_alerts(), 2)
@@ -0,0 +1,175 @@
+"""
+Buffered ingestion of property view events.
+
+``record_view`` only appends the event to an in-process buffer, so the
+detail page never waits on a write transaction. A background thread
+writes the buffer with one ``bulk_create`` whenever it holds
+``PROPERTY_VIEW_BUFFER_SIZE`` events or ``PROPERTY_VIEW_FLUSH_INTERVAL``
+seconds have passed. User-Agent strings are interned into the UserAgent
+table during the flush too. Whatever is still buffered is written at
+interpreter exit, which covers a graceful worker shutdown.
+
+Only connection errors put a batch back in the buffer; if the batch is
+rejected by the database it is retried row by row and the offending rows
+are dropped. The buffer holds at most ``max_pending`` events and drops
+the oldest beyond that. Inserted rows are geolocated by a second thread,
+so a slow lookup service never holds up writes; whatever that thread
+cannot get to is left for the ``geolocate_property_views`` command.
+"""
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, InterfaceError, OperationalError, close_old_connections, transaction
+from django.utils import timezone
+
+from accounts.useragents import resolve_user_agent
+
+from .geolocation import geolocate_views
+from .models import PropertyView
+
+logger = logging.getLogger(__name__)
+
+
+class ViewBuffer:
+    def __init__(self, size=None, interval=None, max_pending=None, geo_worker=True):
+        self.size = size or getattr(settings, 'PROPERTY_VIEW_BUFFER_SIZE', 100)
+        self.interval = interval or getattr(settings, 'PROPERTY_VIEW_FLUSH_INTERVAL', 5)
+        # Events kept while the database is unavailable before dropping the oldest
+        self.max_pending = max_pending or self.size * 50
+        self.dropped = 0
+        self._events = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.geo_worker = geo_worker
+        self._geo_queue = queue.Queue(maxsize=100)
+        self._geo_thread = None
+
+    def add(self, property_id, ip_address, user_agent=''):
+        with self._lock:
+            if len(self._events) >= self.max_pending:
+                del self._events[0]
+                self.dropped += 1
+            self._events.append((PropertyView(
+                property_id=property_id,
+                ip_address=ip_address,
+                viewed_at=timezone.now(),
+            ), user_agent))
+            full = len(self._events) >= self.size
+            self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        with self._lock:
+            return len(self._events)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='property-view-buffer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def flush(self):
+        """Write every buffered event; returns the number of rows inserted."""
+        with self._flush_lock:
+            with self._lock:
+                events, self._events = self._events, []
+                dropped, self.dropped = self.dropped, 0
+            if dropped:
+                logger.warning("View buffer was full, dropped the %d oldest property views", dropped)
+            if not events:
+                return 0
+            try:
+                resolved = {}
+                for view, user_agent in events:
+                    if user_agent not in resolved:
+                        resolved[user_agent] = resolve_user_agent(user_agent)
+                    view.user_agent_id = resolved[user_agent]
+                views = self._insert([view for view, _ in events])
+            except (OperationalError, InterfaceError):
+                logger.exception("Could not write %d property views, keeping them buffered", len(events))
+                with self._lock:
+                    self._events[:0] = events
+                    del self._events[:-self.max_pending]
+                return 0
+            except Exception:
+                logger.exception("Dropping %d property views that could not be written", len(events))
+                return 0
+        self._queue_geolocation(views)
+        return len(views)
+
+    @staticmethod
+    def _insert(views):
+        try:
+            with transaction.atomic():
+                return PropertyView.objects.bulk_create(views)
+        except (IntegrityError, DataError):
+            logger.warning("Batch of %d property views rejected, inserting them one by one", len(views), exc_info=True)
+        inserted = []
+        for view in views:
+            try:
+                with transaction.atomic():
+                    PropertyView.objects.bulk_create([view])
+            except (IntegrityError, DataError) as exc:
+                logger.warning("Dropping view of property %s from %s: %s", view.property_id, view.ip_address, exc)
+                continue
+            inserted.append(view)
+        return inserted
+
+    def _queue_geolocation(self, views):
+        # Backends without RETURNING leave pks unset; the command resolves those
+        views = [view for view in views if view.pk is not None]
+        if not views:
+            return
+        try:
+            self._geo_queue.put_nowait(views)
+        except queue.Full:
+            logger.warning("Geolocation queue full, leaving %d views to geolocate_property_views", len(views))
+            return
+        if self.geo_worker:
+            with self._lock:
+                if self._geo_thread is None or not self._geo_thread.is_alive():
+                    self._geo_thread = threading.Thread(target=self._geo_run, name='property-view-geo', daemon=True)
+                    self._geo_thread.start()
+
+    def geolocate_queued(self, block=False):
+        """Geolocate one queued batch; returns False if there was none."""
+        try:
+            views = self._geo_queue.get(block=block)
+        except queue.Empty:
+            return False
+        try:
+            geolocate_views(views)
+        except Exception:
+            logger.warning("Geolocating buffered views failed", exc_info=True)
+        finally:
+            self._geo_queue.task_done()
+        return True
+
+    def _geo_run(self):
+        while True:
+            try:
+                self.geolocate_queued(block=True)
+            finally:
+                close_old_connections()
+
+
+view_buffer = ViewBuffer()
+atexit.register(view_buffer.flush)
+
+
+def record_view(property_id, ip_address, user_agent=''):
+    view_buffer.add(property_id, ip_address, user_agent)
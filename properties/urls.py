@@ -6,6 +6,9 @@ app_name = 'properties'
 urlpatterns = [
     path('', views.property_list, name='property_list'),
     path('get-properties/', views.get_properties, name='get_properties'),  # This line was missing
+    path('suggest/', views.suggest, name='suggest'),
+    path('map/', views.map_properties, name='map_properties'),
+    path('map/clusters/', views.map_clusters, name='map_clusters'),
     path('<int:property_id>/', views.property_detail, name='property_detail'),
     path('<int:property_id>/schedule-visit/', views.schedule_visit, name='schedule_visit'),
     path('contact/', views.contact_view, name='contact'),
@@ -1,19 +1,7 @@
 # utils.py
-import requests
+from .geolocation import lookup
+
 
 def get_ip_info(ip_address):
-    try:
-        response = requests.get(f'https://ipapi.co/{ip_address}/json/')
-        if response.status_code == 200:
-            data = response.json()
-            return {
-                'country': data.get('country_name'),
-                'region': data.get('region'),
-                'city': data.get('city'),
-                'latitude': data.get('latitude'),
-                'longitude': data.get('longitude'),
-                'isp': data.get('org'),
-            }
-    except Exception:
-        pass
-    return {}
+    """Geolocate an address through the configured, cached resolver (see properties.geolocation)."""
+    return lookup(ip_address) or {}
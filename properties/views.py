@@ -10,106 +10,157 @@ from django.core.paginator import Paginator
 from django.db.models import Q
 from .models import Property, Amenity, PropertyView
 from .forms import ScheduleVisitForm
+from .listing import PAGE_SIZE, normalize_filters, filter_properties, facet_counts, sort_ordering, keyset_page, approximate_total
+from .cache import LISTING_CACHE_TIMEOUT, listing_cache_key
+from .locations import sorted_locations
+from .suggest import suggestion_index
+from django.core.cache import cache
+from .geo import bbox_q, parse_bbox
+from .clusters import clusters_for_viewport
+import math
 import json
 
+DEFAULT_CARD_IMAGE = 'https://images.unsplash.com/photo-1560448204-e02f11c3d0e2?ixlib=rb-4.0.3&auto=format&fit=crop&w=2070&q=80'
+
 def property_list(request):
     """Property listing page with filters"""
-    locations = Property.objects.filter(is_active=True).values_list('location', flat=True).distinct()
-    
     context = {
-        'locations': sorted([loc for loc in locations if loc]),
+        'locations': sorted_locations(),
     }
     return render(request, 'properties/property_list.html', context)
 
+def format_price(price, status):
+    return f'₹{price:,.0f}/month' if status == 'for_rent' else f'₹{price:,.0f}'
+
+def property_card(prop):
+    """JSON representation of a property for the listing cards."""
+    image_url = prop.primary_image.url if prop.primary_image else DEFAULT_CARD_IMAGE
+    card = {
+        'id': prop.id,
+        'title': prop.title,
+        'location': prop.location,
+        'price': format_price(prop.price, prop.status),
+        'type': prop.type,
+        'status': prop.status,
+        'bedrooms': prop.bedrooms,
+        'bathrooms': prop.bathrooms,
+        'image': image_url,
+        # srcset-ready renditions (empty until generated); 'image' stays the fallback
+        'image_avif_srcset': prop.primary_avif_srcset,
+        'image_srcset': prop.primary_webp_srcset,
+        'featured': prop.is_featured,
+        'total_area': f'{prop.total_area} sq.ft.',
+    }
+    # Present in radius ("near me") searches
+    if getattr(prop, 'distance_sq', None) is not None:
+        card['distance_km'] = round(math.sqrt(prop.distance_sq), 2)
+    return card
+
 def get_properties(request):
     """AJAX endpoint for property filtering and pagination"""
-    status = request.GET.get('status', 'all')
-    property_type = request.GET.get('type', 'all')
-    location = request.GET.get('location', 'all')
-    bedrooms = request.GET.get('bedrooms', 'all')
-    price_range = request.GET.get('price', 'all')
-    search_query = request.GET.get('search', '')
-    sort_by = request.GET.get('sort', 'newest')
+    filters = normalize_filters(request.GET)
     page_number = int(request.GET.get('page', 1))
-    
-    properties = Property.objects.filter(is_active=True)
-    
-    if status != 'all':
-        properties = properties.filter(status=status)
-    
-    if property_type != 'all':
-        properties = properties.filter(type=property_type)
-    
-    if location != 'all':
-        properties = properties.filter(location__icontains=location)
-    
-    if bedrooms != 'all':
-        if bedrooms == '4':
-            properties = properties.filter(bedrooms__gte=4)
-        else:
-            properties = properties.filter(bedrooms=bedrooms)
-    
-    if price_range != 'all':
-        price_ranges = {
-            '0-20': (0, 2000000),
-            '20-40': (2000000, 4000000),
-            '40-60': (4000000, 6000000),
-            '60-100': (6000000, 10000000),
-            '100-999': (10000000, 999999999)
+    cursor = request.GET.get('cursor')
+    with_total = request.GET.get('total') == '1'
+    with_facets = request.GET.get('facets') == '1'
+
+    # Responses are cached per normalized request until the next catalogue write
+    cache_key = listing_cache_key('listing', {
+        **filters,
+        'page': page_number,
+        'cursor': cursor,
+        'total': with_total,
+        'facets': with_facets,
+    })
+    data = cache.get(cache_key)
+    if data is not None:
+        return JsonResponse(data)
+
+    properties = filter_properties(**filters)
+
+    # Keyset pagination: opt in with ?cursor= (empty for the first page)
+    if cursor is not None:
+        ordering = sort_ordering(filters['sort_by'], filters['search_query'], filters['near'])
+        try:
+            page, next_cursor = keyset_page(properties, ordering, cursor)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid cursor.'}, status=400)
+
+        data = {
+            'properties': [property_card(prop) for prop in page],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None,
+        }
+        if with_total:
+            data['approximate_total'] = approximate_total(properties, filters)
+    else:
+        # Pagination
+        paginator = Paginator(properties, PAGE_SIZE)
+        page_obj = paginator.get_page(page_number)
+
+        data = {
+            'properties': [property_card(prop) for prop in page_obj],
+            'current_page': page_number,
+            'total_pages': paginator.num_pages,
+            'total_properties': paginator.count,
+            'has_next': page_obj.has_next(),
+            'has_previous': page_obj.has_previous(),
         }
-        if price_range in price_ranges:
-            min_price, max_price = price_ranges[price_range]
-            properties = properties.filter(price__gte=min_price, price__lte=max_price)
-    
-    if search_query:
-        properties = properties.filter(
-            Q(title__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(location__icontains=search_query)
+
+    if with_facets:
+        data['facets'] = facet_counts(**filters)
+
+    cache.set(cache_key, data, LISTING_CACHE_TIMEOUT)
+    return JsonResponse(data)
+
+MAX_MAP_PINS = 500
+
+def map_properties(request):
+    """AJAX endpoint returning the map pins inside the visible viewport"""
+    try:
+        south, west, north, east = parse_bbox(request.GET.get('bbox', ''))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'bbox must be "south,west,north,east" in degrees.'}, status=400)
+
+    bbox = [round(value, 4) for value in (south, west, north, east)]
+    cache_key = listing_cache_key('map', {'bbox': bbox})
+    data = cache.get(cache_key)
+    if data is None:
+        rows = list(
+            Property.objects.filter(bbox_q(*bbox), is_active=True)
+            .order_by('-featured', '-created_at')
+            .values('id', 'title', 'latitude', 'longitude', 'price', 'status')[:MAX_MAP_PINS + 1]
         )
-    
-    # Apply sorting
-    if sort_by == 'price-low':
-        properties = properties.order_by('price')
-    elif sort_by == 'price-high':
-        properties = properties.order_by('-price')
-    elif sort_by == 'name':
-        properties = properties.order_by('title')
-    else:  # newest
-        properties = properties.order_by('-created_at')
-    
-    # Pagination
-    paginator = Paginator(properties, 9)
-    page_obj = paginator.get_page(page_number)
-    
-    property_data = []
-    for prop in page_obj:
-        primary_image = prop.images.filter(is_primary=True).first()
-        image_url = primary_image.image.url if primary_image and primary_image.image else 'https://images.unsplash.com/photo-1560448204-e02f11c3d0e2?ixlib=rb-4.0.3&auto=format&fit=crop&w=2070&q=80'
-        price_display = f'₹{prop.price:,.0f}/month' if prop.status == 'for_rent' else f'₹{prop.price:,.0f}'
-        
-        property_data.append({
-            'id': prop.id,
-            'title': prop.title,
-            'location': prop.location,
-            'price': price_display,
-            'type': prop.type,
-            'status': prop.status,
-            'bedrooms': prop.bedrooms,
-            'bathrooms': prop.bathrooms,
-            'image': image_url,
-            'featured': prop.is_featured,
-            'total_area': f'{prop.total_area} sq.ft.',
-        })
-    
-    return JsonResponse({
-        'properties': property_data,
-        'current_page': page_number,
-        'total_pages': paginator.num_pages,
-        'total_properties': paginator.count,
-        'has_next': page_obj.has_next(),
-        'has_previous': page_obj.has_previous(),
-    })
+        data = {
+            'pins': [
+                {
+                    'id': row['id'],
+                    'title': row['title'],
+                    'lat': float(row['latitude']),
+                    'lng': float(row['longitude']),
+                    'price': format_price(row['price'], row['status']),
+                }
+                for row in rows[:MAX_MAP_PINS]
+            ],
+            'truncated': len(rows) > MAX_MAP_PINS,
+        }
+        cache.set(cache_key, data, LISTING_CACHE_TIMEOUT)
+    return JsonResponse(data)
+
+def map_clusters(request):
+    """AJAX endpoint returning per-cell pin clusters for the viewport at a zoom level"""
+    try:
+        south, west, north, east = parse_bbox(request.GET.get('bbox', ''))
+        zoom = int(request.GET.get('zoom', 12))
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'bbox must be "south,west,north,east" in degrees and zoom an integer.'}, status=400)
+
+    return JsonResponse(clusters_for_viewport(south, west, north, east, zoom))
+
+def suggest(request):
+    """AJAX typeahead for the search box, answered from the in-process prefix index"""
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({'suggestions': suggestion_index.suggest(query)})
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse, Http404
 from django.core.paginator import Paginator
@@ -122,7 +173,8 @@ import json
 from django.shortcuts import render, get_object_or_404
 from .models import Property, PropertyView
 from .forms import ScheduleVisitForm
-from .utils import get_ip_info
+from .tracking import record_view
+from .detail import FRAGMENT_TIMEOUT, detail_queryset, load_fragment_content, similar_properties as similar_for
 
 def get_client_ip(request):
     """Handles proxies (X-Forwarded-For) properly"""
@@ -136,7 +188,7 @@ def get_client_ip(request):
 
 def property_detail(request, property_id):
     """Property detail page"""
-    property_obj = get_object_or_404(Property, id=property_id, is_active=True)
+    property_obj = get_object_or_404(detail_queryset(), id=property_id)
     is_saved = False
     if request.user.is_authenticated:
         is_saved = SavedProperty.objects.filter(user=request.user, property=property_obj).exists()
@@ -145,26 +197,11 @@ def property_detail(request, property_id):
     ip_address = get_client_ip(request)
     user_agent = request.META.get('HTTP_USER_AGENT', '')
 
-    ip_data = get_ip_info(ip_address)
-
-    PropertyView.objects.create(
-        property=property_obj,
-        ip_address=ip_address,
-        user_agent=user_agent,
-        country=ip_data.get('country'),
-        region=ip_data.get('region'),
-        city=ip_data.get('city'),
-        latitude=ip_data.get('latitude'),
-        longitude=ip_data.get('longitude'),
-        isp=ip_data.get('isp'),
-    )
+    # Buffered and written in batches (with geolocation) off the request path
+    record_view(property_obj.id, ip_address, user_agent)
 
-    # Get similar properties
-    similar_properties = Property.objects.filter(
-        is_active=True,
-        type=property_obj.type,
-        status=property_obj.status
-    ).exclude(id=property_obj.id)[:3]
+    load_fragment_content(property_obj)
+    similar_properties = similar_for(property_obj)
 
     form = ScheduleVisitForm()
 
@@ -173,15 +210,18 @@ def property_detail(request, property_id):
         'similar_properties': similar_properties,
         'form': form,
         'is_saved': is_saved,
+        'fragment_timeout': FRAGMENT_TIMEOUT,
     }
     return render(request, 'properties/property_detail.html', context)
 
 
-from django.core.mail import send_mail
+from django.db import transaction
 from django.http import JsonResponse
 from django.conf import settings
+from accounts.outbox import queue_mass_email
 from .models import Property, ScheduledVisit
 
+@transaction.atomic
 def schedule_visit(request, property_id):
     if request.method == 'POST':
         name = request.POST.get('name')
@@ -222,14 +262,6 @@ def schedule_visit(request, property_id):
                 f"— DreamHomes Realty"
             )
 
-            send_mail(
-                subject_agent,
-                message_agent,
-                settings.DEFAULT_FROM_EMAIL,
-                [agent_email],
-                fail_silently=False,
-            )
-
             # ---------- Email Confirmation to User ----------
             subject_user = f"Visit Confirmation — {property_obj.title}"
             message_user = (
@@ -244,13 +276,10 @@ def schedule_visit(request, property_id):
                 f"DreamHomes Realty"
             )
 
-            send_mail(
-                subject_user,
-                message_user,
-                settings.DEFAULT_FROM_EMAIL,
-                [email],
-                fail_silently=False,
-            )
+            queue_mass_email((
+                (subject_agent, message_agent, None, [agent_email]),
+                (subject_user, message_user, None, [email]),
+            ))
 
             return JsonResponse({'success': True, 'message': 'Your visit has been scheduled successfully! A confirmation email has been sent.'})
 
@@ -263,13 +292,13 @@ from django.shortcuts import render, redirect
 from django.contrib import messages
 from .forms import ContactForm  # Make sure you have a ContactForm in forms.py
 
-from django.core.mail import send_mail
 from django.contrib import messages
 from django.shortcuts import render, redirect
 from django.conf import settings
 from .forms import ContactForm
 from .models import ContactMessage
 
+@transaction.atomic
 def contact_view(request):
     if request.method == 'POST':
         form = ContactForm(request.POST)
@@ -288,14 +317,6 @@ def contact_view(request):
                 f"---\nThis message was sent from DreamHomes Realty website."
             )
 
-            send_mail(
-                subject_admin,
-                message_admin,
-                settings.DEFAULT_FROM_EMAIL,
-                ['info@dreamhomesrealty.com'],  # Admin/sales team email
-                fail_silently=False,
-            )
-
             # ----- Confirmation Email to User -----
             subject_user = "Thank you for contacting DreamHomes Realty"
             message_user = (
@@ -311,13 +332,10 @@ def contact_view(request):
                 f"✉️ info@dreamhomesrealty.com"
             )
 
-            send_mail(
-                subject_user,
-                message_user,
-                settings.DEFAULT_FROM_EMAIL,
-                [contact.email],
-                fail_silently=False,
-            )
+            queue_mass_email((
+                (subject_admin, message_admin, None, ['info@dreamhomesrealty.com']),  # Admin/sales team email
+                (subject_user, message_user, None, [contact.email]),
+            ))
 
             messages.success(request, "Your message has been sent successfully! Check your email for confirmation.")
             return redirect('properties:contact')